@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Helpers shared by benchmark scripts. Scripts are run from any directory
+and print one result per line, so runs are easy to compare:
+
+python benchmarks/parse_scaling.py
+
+Scripts which take <code>--path</code> option benchmark zencoding package
+from another checkout instead of this one, e.g. an older revision:
+
+git worktree add /tmp/zc-old <revision>
+python benchmarks/parse_scaling.py --path /tmp/zc-old
+'''
+import argparse
+import collections
+import collections.abc
+import os
+import statistics
+import subprocess
+import sys
+import time
+import types
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+"Directory with zencoding package"
+
+def parse_args(description, args=None):
+	"""
+	Parses common options of benchmark script and makes selected zencoding
+	package importable. Must be called before zencoding is imported
+	@param description: Benchmark description
+	@type description: str
+	@return: argparse.Namespace
+	"""
+	parser = argparse.ArgumentParser(description=description)
+	parser.add_argument('--path', default=repo_dir, metavar='DIR',
+			help='checkout with zencoding package to benchmark (default: this one)')
+	options = parser.parse_args(args)
+	use_package(options.path)
+	return options
+
+def use_package(path):
+	"""
+	Makes zencoding package from <code>path</code> directory importable.
+	Package's __init__ is not executed: older revisions import Gedit plugin 
+	there unconditionally
+	@type path: str
+	"""
+	package = types.ModuleType('zencoding')
+	package.__path__ = [os.path.join(os.path.abspath(path), 'zencoding')]
+	sys.modules['zencoding'] = package
+	
+	# older revisions use alias removed in Python 3.10
+	if not hasattr(collections, 'Callable'):
+		collections.Callable = collections.abc.Callable
+
+def measure(func, repeat=5, best=False):
+	"""
+	Calls <code>func</code> several times and returns median run time
+	@type func: function
+	@type repeat: int
+	@param best: Return the best time instead of median
+	@type best: bool
+	@return: float, seconds
+	"""
+	times = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - start)
+	
+	return min(times) if best else statistics.median(times)
+
+def measure_command(args, input=b'', repeat=21):
+	"""
+	Runs Python interpreter with <code>args</code> in new process several
+	times and returns median wall time
+	@type args: list
+	@type input: bytes
+	@type repeat: int
+	@return: float, seconds
+	"""
+	def run():
+		subprocess.run([sys.executable] + args, input=input, cwd=repo_dir,
+				stdout=subprocess.DEVNULL, check=True)
+	
+	run()
+	return measure(run, repeat)
+
+def report(name, value, unit='ms'):
+	"""
+	Prints single benchmark result
+	@param value: Result; seconds are converted to milliseconds for 'ms' unit
+	"""
+	if unit == 'ms':
+		value *= 1000
+	
+	if isinstance(value, int):
+		print('%-44s %10d %s' % (name, value, unit))
+	else:
+		print('%-44s %10.2f %s' % (name, value, unit))
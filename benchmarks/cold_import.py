@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Cold import of filters package with lookup of 'html' and '_format'
+filters, measured in a fresh interpreter after zen_core is imported.
+Also reports how many zencoding modules are loaded by it.
+'''
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import bench
+
+child_code = '''
+import sys, time
+sys.path.insert(0, %(bench_dir)r)
+import bench
+bench.use_package(%(path)r)
+from zencoding import zen_core
+loaded = set(sys.modules)
+start = time.perf_counter()
+from zencoding import filters
+for name in ('html', '_format'):
+	filters.filter_map[name]
+elapsed = time.perf_counter() - start
+modules = [m for m in set(sys.modules) - loaded if m.startswith('zencoding')]
+print('{"time": %%r, "modules": %%d}' %% (elapsed, len(modules)))
+'''
+
+def main():
+	options = bench.parse_args(__doc__)
+	code = child_code % {'bench_dir': os.path.dirname(os.path.abspath(__file__)), 'path': options.path}
+	
+	results = []
+	for i in range(25):
+		output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, 
+				check=True).stdout
+		results.append(json.loads(output))
+	
+	bench.report('import filters, lookup html and _format',
+			statistics.median([r['time'] for r in results]))
+	bench.report('zencoding modules loaded', results[0]['modules'], 'modules')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Expansion time of abbreviations with many elements of different types
+(inline, block and empty), which makes element classification lookups 
+frequent. Caches are invalidated before each run, so each run parses, 
+rolls out and formats abbreviation with xhtml profile.
+'''
+import bench
+
+cases = [
+	('p>' + '+'.join(['span', 'em', 'b', 'a', 'img', 'code'] * 100), 'p>span+em+b+a+img+code x100 siblings'),
+	('div>p>a+span+img+br+em+' + '+'.join(['a', 'span', 'div', 'br'] * 150), 'div>p>... + 600 mixed siblings'),
+	('table>tr*40>td*10>a+span', 'table>tr*40>td*10>a+span')
+]
+
+def main():
+	bench.parse_args(__doc__)
+	from zencoding import zen_core
+	
+	invalidate = getattr(zen_core, 'invalidate_caches', lambda: None)
+	def expand(abbr):
+		invalidate()
+		return zen_core.expand_abbreviation(abbr, 'html', 'xhtml')
+	
+	for abbr, name in cases:
+		assert expand(abbr)
+		bench.report(name, bench.measure(lambda: expand(abbr), 7, best=True))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Batch expansion of 40k generated abbreviations with html syntax and xhtml
+profile: loop over expand_abbreviation() compared with expand_many() 
+with different number of workers. expand_many() never starts more workers
+than there are CPU cores, so on single core machine all its runs are
+serial; run on a multi-core machine to see pool scaling.
+'''
+import os
+
+import bench
+
+def create_batch(size):
+	"@return: list of abbreviations, with some repeats"
+	return ['div#i%d.c%d>p*%d>a[href=u%d]+span' % (i, i % 7, i % 3 + 1, i % 5)
+			for i in range(size)] + ['ul>li*3'] * (size // 80)
+
+def main():
+	bench.parse_args(__doc__)
+	from zencoding import zen_core
+	
+	batch = create_batch(40000)
+	bench.report('CPU cores', os.cpu_count() or 1, 'cores')
+	
+	expected = [zen_core.expand_abbreviation(abbr, 'html', 'xhtml') for abbr in batch]
+	
+	def loop():
+		zen_core.invalidate_caches()
+		return [zen_core.expand_abbreviation(abbr, 'html', 'xhtml') for abbr in batch]
+	
+	bench.report('loop over expand_abbreviation', bench.measure(loop, 3), 's')
+	
+	for workers in (1, 2, 4, None):
+		assert zen_core.expand_many(batch, 'html', 'xhtml', workers) == expected
+		elapsed = bench.measure(lambda: zen_core.expand_many(batch, 'html', 'xhtml', workers), 3)
+		bench.report('expand_many(workers=%s)' % workers, elapsed, 's')
+
+if __name__ == '__main__':
+	main()
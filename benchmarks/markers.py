@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Replacement of unescaped symbols in strings with many markers: 
+<code>replace_unescaped_symbol()</code> should take linear time.
+'''
+import bench
+
+def main():
+	bench.parse_args(__doc__)
+	from zencoding import zen_core
+	
+	for count in (1000, 10000, 50000):
+		text = 'item | ' * count
+		assert zen_core.replace_unescaped_symbol(text, '|', 'X').count('X') == count
+		
+		elapsed = bench.measure(lambda: zen_core.replace_unescaped_symbol(text, '|', 'X'), 3)
+		bench.report('replace %d markers' % count, elapsed)
+
+if __name__ == '__main__':
+	main()
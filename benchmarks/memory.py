@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Memory taken by abbreviation tree (<code>Tag</code>) and output tree 
+(<code>ZenNode</code>) nodes, in bytes per node as reported by tracemalloc.
+'''
+import gc
+import tracemalloc
+
+import bench
+
+def count_nodes(tree):
+	"@return: Number of descendants of tree node"
+	count = 0
+	stack = list(tree.children)
+	while stack:
+		node = stack.pop()
+		count += 1
+		stack.extend(node.children)
+	return count
+
+def measure_memory(func):
+	"""
+	Calls <code>func</code> and returns its result with amount of memory
+	allocated by call and still in use
+	@return: (result, bytes) tuple
+	"""
+	gc.collect()
+	tracemalloc.start()
+	try:
+		result = func()
+		return result, tracemalloc.get_traced_memory()[0]
+	finally:
+		tracemalloc.stop()
+
+def main():
+	bench.parse_args(__doc__)
+	from zencoding import zen_core
+	
+	# every repeated element must be a separate node
+	zen_core.lazy_repeat_threshold = 10 ** 9
+	parse = getattr(zen_core, '_parse_into_tree', zen_core.parse_into_tree)
+	
+	root = parse('div#main>ul.list>li.item*50000>a[href=#]', 'html')
+	tree, size = measure_memory(lambda: zen_core.rollout_tree(root))
+	count = count_nodes(tree)
+	bench.report('ZenNode, rollout of %d nodes' % count, size / count, 'bytes/node')
+	del tree
+	
+	root, size = measure_memory(lambda: parse('+'.join(['p.a#b'] * 20000), 'html'))
+	count = count_nodes(root)
+	bench.report('Tag, parse of %d nodes' % count, size / count, 'bytes/node')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Abbreviation parsing time for growing abbreviations: parser walks the
+abbreviation once, so time per 1000 characters should stay about the same.
+Parse caches are bypassed.
+'''
+import bench
+
+def create_abbreviation(size):
+	"""
+	Generates abbreviation of <code>size</code> siblings: elements with
+	attributes and children alternate with groups
+	@return: str
+	"""
+	return '+'.join([i % 2 and 'div#a%d.b>p*2>a[href=x]' % i or '(ul>li.x*3)'
+			for i in range(size)])
+
+def main():
+	bench.parse_args(__doc__)
+	from zencoding import zen_core
+	
+	# uncached parser of current revision, public function of older ones
+	parse = getattr(zen_core, '_parse_into_tree', zen_core.parse_into_tree)
+	
+	for size in (250, 1000, 4000):
+		abbr = create_abbreviation(size)
+		assert parse(abbr, 'html') is not None
+		
+		elapsed = bench.measure(lambda: parse(abbr, 'html'), 5, best=True)
+		bench.report('parse, %d chars' % len(abbr), elapsed)
+		bench.report('parse, %d chars, per 1000 chars' % len(abbr), elapsed * 1000 / len(abbr))
+
+if __name__ == '__main__':
+	main()
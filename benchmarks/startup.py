@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Start up time of command line interface: wall time of a new process
+running 'python -m zencoding expand' for a single abbreviation, compared
+with bare interpreter start and plain zen_core import. Overhead is the
+time spent above bare interpreter start.
+'''
+import bench
+
+def main():
+	bare = bench.measure_command(['-c', 'pass'])
+	imports = bench.measure_command(['-c', 'import zencoding.zen_core'])
+	expand = bench.measure_command(['-m', 'zencoding', 'expand'], b'ul>li*3\n')
+	
+	bench.report('interpreter start', bare)
+	bench.report('import zen_core', imports)
+	bench.report('import zen_core, overhead', imports - bare)
+	bench.report('expand command', expand)
+	bench.report('expand command, overhead', expand - bare)
+
+if __name__ == '__main__':
+	main()
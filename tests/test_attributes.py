@@ -0,0 +1,64 @@
+'''
+Lexing of abbreviation attributes: <code>extract_attributes()</code>,
+<code>parse_attributes()</code> and <code>Tag.add_attributes()</code>.
+'''
+from zencoding import zen_core
+
+def test_unquoted_values():
+	assert zen_core.extract_attributes('a b=1 c=x-y') == [('a', ''), ('b', '1'), ('c', 'x-y')]
+
+def test_quoted_values():
+	assert zen_core.extract_attributes('title="hello world" x') == [('title', 'hello world'), ('x', '')]
+	assert zen_core.extract_attributes("t='q w' u=v") == [('t', 'q w'), ('u', 'v')]
+	assert zen_core.extract_attributes('data-x="a b" z') == [('data-x', 'a b'), ('z', '')]
+
+def test_attribute_range():
+	text = '[a=1 b="2"]'
+	assert zen_core.extract_attributes(text, 1, len(text) - 1) == [('a', '1'), ('b', '2')]
+
+def test_broken_values():
+	# unterminated quote stops lexing at this attribute
+	assert zen_core.extract_attributes('x="unterminated y=1') == [('x', '')]
+	# '=' at the end of set gives empty value
+	assert zen_core.extract_attributes('x=') == [('x', '')]
+	# no attribute name
+	assert zen_core.extract_attributes('=x') == []
+
+def test_parse_attributes():
+	assert zen_core.parse_attributes('#id.a.b[x=1 y]') == \
+			[('id', 'id'), ('class', 'a b'), ('x', '1'), ('y', '')]
+	assert zen_core.parse_attributes('.c1[x]#i.c2') == \
+			[('class', 'c1 c2'), ('x', ''), ('id', 'i')]
+	assert zen_core.parse_attributes('[a=1][b=2]') == [('a', '1'), ('b', '2')]
+
+def test_missing_closing_bracket():
+	assert zen_core.parse_attributes('[title=hi') == []
+	assert zen_core.parse_attributes('#a[title=hi') == [('id', 'a')]
+	assert zen_core.expand_abbreviation('a[title=hi', 'html', 'plain') == ''
+
+def test_add_attributes():
+	tag = zen_core.Tag('div')
+	tag.add_attributes([('class', 'a'), ('id', 'x'), ('class', 'b'), ('id', 'y')])
+	assert tag.attributes == [{'name': 'class', 'value': 'a b'}, {'name': 'id', 'value': 'y'}]
+	
+	tag.add_attribute('title', 'hi')
+	tag.add_attribute('class', 'c')
+	assert tag.attributes == [{'name': 'class', 'value': 'a b c'}, 
+			{'name': 'id', 'value': 'y'}, {'name': 'title', 'value': 'hi'}]
+
+def test_expanded_attributes():
+	assert zen_core.expand_abbreviation('div.a[class=b x=1 y="2 3"]', 'html', 'plain') == \
+			'<div class="a b" x="1" y="2 3"></div>'
+
+def test_many_attributes():
+	count = 10000
+	attrs = ' '.join(['a%d="v %d"' % (i, i) for i in range(count)])
+	
+	result = zen_core.parse_attributes('#id[' + attrs + '].c')
+	assert len(result) == count + 2
+	assert result[1] == ('a0', 'v 0')
+	assert result[-2] == ('a%d' % (count - 1), 'v %d' % (count - 1))
+	
+	output = zen_core.expand_abbreviation('div[' + attrs + ']', 'html', 'plain')
+	assert output.count('="v ') == count
+	assert output.endswith(' a%d="v %d"></div>' % (count - 1, count - 1))
@@ -0,0 +1,55 @@
+'''
+Command line interface: expand command and its error reporting
+'''
+import io
+import json
+
+import pytest
+
+from zencoding import zen_core, __main__ as cli
+
+@pytest.fixture(autouse=True)
+def caret():
+	# expand command sets caret placeholder of current context
+	placeholder = zen_core.get_context().caret_placeholder
+	yield
+	zen_core.set_caret_placeholder(placeholder)
+
+def run(args, stdin, monkeypatch):
+	monkeypatch.setattr('sys.stdin', io.StringIO(stdin))
+	return cli.main(args)
+
+def test_expand_lines(monkeypatch, capsys):
+	assert run(['expand', '-p', 'plain'], 'ul>li*2\n\np.a\n', monkeypatch) == 0
+	assert capsys.readouterr().out == '<ul><li></li><li></li></ul>\n<p class="a"></p>\n'
+
+def test_unknown_profile(monkeypatch, capsys):
+	with pytest.raises(SystemExit) as e:
+		run(['expand', '--profile', 'bogus'], 'p\n', monkeypatch)
+	
+	assert e.value.code != 0
+	err = capsys.readouterr().err
+	assert 'invalid choice' in err and 'Traceback' not in err
+
+def test_missing_file(monkeypatch, capsys, tmp_path):
+	path = str(tmp_path / 'missing.txt')
+	with pytest.raises(SystemExit) as e:
+		run(['expand', '-', path], 'p\n', monkeypatch)
+	
+	assert e.value.code == 1
+	out, err = capsys.readouterr()
+	assert out == '<p></p>\n'
+	assert err == "python -m zencoding: error: can't read %s: No such file or directory\n" % path
+
+def test_jsonl_errors_are_reported_per_line(monkeypatch, capsys):
+	lines = ['{"abbr": "p", "profile": "bogus"}', 'not json', '{"id": 1}',
+			'"a"', '{"abbr": "p.x", "profile": "plain"}']
+	assert run(['expand', '--jsonl'], '\n'.join(lines) + '\n', monkeypatch) == 1
+	
+	items = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+	assert [sorted(item) for item in items] == [
+		['abbr', 'error', 'profile'], ['error'], ['error', 'id'],
+		['abbr', 'result'], ['abbr', 'profile', 'result']
+	]
+	assert items[0]['error'] == 'Unknown profile: bogus'
+	assert items[-1]['result'] == '<p class="x"></p>'
@@ -0,0 +1,20 @@
+'''
+Comment filter numbers comments by node position among expanded siblings
+'''
+from zencoding import zen_core
+
+def comments(abbr):
+	result = zen_core.expand_abbreviation(abbr + '|c', 'html', 'xhtml')
+	return [line.strip()[6:-4] for line in result.splitlines()
+			if line.strip().startswith('<!-- /')]
+
+def test_position_among_siblings():
+	assert comments('p+div#x$*2+div.y$') == ['#x2', '#x3', '.y4']
+
+def test_nested_positions():
+	assert comments('ul>li.a$*2>div.b$') == ['.b1', '.a1', '.b1', '.a2']
+
+def test_lazy_repeated_siblings():
+	count = zen_core.lazy_repeat_threshold + 10
+	result = comments('p*3+div.x*%d+div.y$' % count)
+	assert result[-1] == '.y%d' % (count + 4)
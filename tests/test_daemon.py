@@ -0,0 +1,56 @@
+'''
+Expansion daemon and in-process fallback of its client
+'''
+import os
+import subprocess
+import sys
+
+import pytest
+
+from zencoding import zen_daemon
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+requests = [
+	('ul#nav>li.item$*3>a', 'html', 'xhtml', ''),
+	('div>p|e', 'html', 'html', '\t'),
+	('a[href=x|y]', 'html', 'xml', ''),
+	('m|fc', 'css', 'plain', '  '),
+	('div.item$*2>p', 'haml', 'xhtml', '')
+]
+
+@pytest.fixture(scope='module')
+def daemon(tmp_path_factory):
+	path = str(tmp_path_factory.mktemp('daemon') / 'zc.sock')
+	process = subprocess.Popen([sys.executable, '-m', 'zencoding', 'serve', '--socket', path],
+			cwd=root, stdout=subprocess.PIPE, universal_newlines=True)
+	try:
+		# message is printed once socket is bound
+		assert process.stdout.readline() == 'Serving on %s\n' % path
+		assert os.path.exists(path)
+		yield path
+	finally:
+		process.terminate()
+		process.wait(10)
+		process.stdout.close()
+
+def test_fallback_matches_daemon(daemon, tmp_path):
+	client = zen_daemon.Client(daemon, fallback=False)
+	fallback = zen_daemon.Client(str(tmp_path / 'missing.sock'))
+	try:
+		for abbr, syntax, profile, indent in requests:
+			expected = client.expand_abbreviation(abbr, syntax, profile, indent)
+			assert fallback.expand_abbreviation(abbr, syntax, profile, indent) == expected
+		
+		expected = client.wrap_with_abbreviation('ul>li*', 'a\nb', 'html', 'xhtml')
+		assert fallback.wrap_with_abbreviation('ul>li*', 'a\nb', 'html', 'xhtml') == expected
+		assert fallback.stats() is None
+	finally:
+		client.close()
+
+def test_no_message_if_socket_is_taken(daemon):
+	process = subprocess.run([sys.executable, '-m', 'zencoding', 'serve', '--socket', daemon],
+			cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+	assert process.returncode == 1
+	assert process.stdout == ''
+	assert 'already running' in process.stderr
@@ -0,0 +1,46 @@
+'''
+Expanding very deep abbreviations: tree is parsed, rolled out, filtered
+and serialized without recursion, and cost of each nesting level doesn't
+grow with depth.
+'''
+import sys
+import time
+
+from zencoding import zen_core
+
+depth = 10000
+
+def expand_chain(levels):
+	"""
+	Expands chain of nested divs with 'plain' profile
+	@return: (output, seconds per level) tuple
+	"""
+	abbr = '>'.join(['div'] * levels)
+	zen_core.invalidate_caches()
+	start = time.perf_counter()
+	output = zen_core.expand_abbreviation(abbr, 'html', 'plain')
+	return output, (time.perf_counter() - start) / levels
+
+def test_deep_nesting_expands():
+	assert depth > sys.getrecursionlimit()
+	
+	output, per_level = expand_chain(depth)
+	sys.stdout.write('\n%d levels: %.1f us per level\n' % (depth, per_level * 1e6))
+	assert output == '<div>' * depth + '</div>' * depth
+
+def test_deep_nesting_streaming():
+	abbr = '>'.join(['div'] * depth)
+	output = ''.join(zen_core.iter_expand_abbreviation(abbr, 'html', 'plain'))
+	assert output == '<div>' * depth + '</div>' * depth
+
+def test_deep_nesting_cost_per_level():
+	# warm up filter imports
+	expand_chain(10)
+	
+	small = min(expand_chain(depth // 10)[1] for i in range(3))
+	large = min(expand_chain(depth)[1] for i in range(3))
+	sys.stdout.write('\nper level: %.1f us at %d levels, %.1f us at %d levels\n' % 
+			(small * 1e6, depth // 10, large * 1e6, depth))
+	
+	# quadratic traversal would make each level about 10 times slower
+	assert large < small * 3
@@ -0,0 +1,76 @@
+'''
+Compiled (cached) and streamed expansion of the same abbreviation give
+the same output for all syntaxes, profiles and filters.
+'''
+import pytest
+
+from zencoding import zen_core
+
+abbreviations = [
+	'div', 'ul#nav>li.item$$*3>a', 'div.item$*3', 'li.x$*2>a.y$', 'a.b$',
+	'html:5', 'table+', 'div>(p>b)+span>(a)', 'a[href=x|y]', 'div#a.b.c[title=hi]',
+	'div#x.y', 'p*2>span*2>b', 'm', 'bg+', '@i', 'fl:l', 'p+p', 'pos+t+r',
+	'cc:ie>div', 'xsl:variable>p', 'table>tr*2>td*2', 'p*200'
+]
+
+syntaxes = ['html', 'css', 'xsl', 'haml']
+profiles = ['xhtml', 'html', 'xml', 'plain']
+filters = ['', '|c', '|e', '|haml', '|fc', '|html', '|xsl']
+
+def outcome(func, *args):
+	"""
+	Returns result of function call or name of raised exception: some
+	snippets can't be used with comment filter, and both paths have to
+	fail in the same way
+	"""
+	try:
+		return func(*args)
+	except Exception as e:
+		return type(e).__name__
+
+def stream(*args):
+	return ''.join(zen_core.iter_expand_abbreviation(*args))
+
+@pytest.mark.parametrize('syntax', syntaxes)
+@pytest.mark.parametrize('profile', profiles)
+@pytest.mark.parametrize('filter_list', filters)
+def test_compiled_matches_streamed(syntax, profile, filter_list):
+	for abbr in abbreviations:
+		abbr += filter_list
+		for base_indent in ('', '  '):
+			args = (abbr, syntax, profile, base_indent)
+			streamed = outcome(stream, *args)
+			# second call renders cached template
+			assert outcome(zen_core.expand_abbreviation, *args) == streamed
+			assert outcome(zen_core.expand_abbreviation, *args) == streamed
+
+def test_large_output_matches_streamed():
+	abbr = 'ul>li.item$*%d>a' % (zen_core.max_template_size // 10)
+	streamed = ''.join(zen_core.iter_expand_abbreviation(abbr, 'html', 'xhtml', '\t'))
+	assert len(streamed) > zen_core.max_template_size
+	assert zen_core.expand_abbreviation(abbr, 'html', 'xhtml', '\t') == streamed
+	assert zen_core.compile_abbreviation(abbr, 'html', 'xhtml').render('\t') == streamed
+
+def test_profile_object_matches_name():
+	profile = zen_core.get_profile('xhtml')
+	for abbr in abbreviations:
+		assert zen_core.expand_abbreviation(abbr, 'html', profile) == \
+				zen_core.expand_abbreviation(abbr, 'html', 'xhtml')
+
+def test_haml_counters():
+	assert zen_core.expand_abbreviation('div.item$*3|haml', 'html', 'xhtml') == \
+			''.join(zen_core.iter_expand_abbreviation('div.item$*3|haml', 'html', 'xhtml'))
+
+def test_context_changes():
+	abbr = 'ul>li*2'
+	expected = '<ul>\n\t<li>|</li>\n\t<li>|</li>\n</ul>'
+	context = zen_core.ExpansionContext(caret_placeholder='|')
+	with context:
+		assert zen_core.expand_abbreviation(abbr, 'html', 'xhtml') == expected
+		
+		zen_core.set_newline('\r\n')
+		assert zen_core.expand_abbreviation(abbr, 'html', 'xhtml') == expected.replace('\n', '\r\n')
+		
+		zen_core.set_newline('\n')
+		context.variables['indentation'] = '  '
+		assert zen_core.expand_abbreviation(abbr, 'html', 'xhtml') == expected.replace('\t', '  ')
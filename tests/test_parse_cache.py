@@ -0,0 +1,37 @@
+'''
+Compiled expansion path reuses parsed abbreviations from parse cache
+'''
+from zencoding import zen_core
+
+def parse_hits():
+	return zen_core.cache_stats()['parse']['hits']
+
+def test_profiles_share_parsed_tree():
+	zen_core.invalidate_caches()
+	zen_core.expand_abbreviation('ul#nav>li.item$*3>a', 'html', 'xhtml')
+	hits = parse_hits()
+	zen_core.expand_abbreviation('ul#nav>li.item$*3>a', 'html', 'html')
+	zen_core.expand_abbreviation('ul#nav>li.item$*3>a', 'html', 'xml')
+	assert parse_hits() == hits + 2
+
+def test_large_output_uses_parse_cache():
+	abbr = 'table>tr*300>td*20'
+	zen_core.invalidate_caches()
+	first = zen_core.expand_abbreviation(abbr, 'html', 'xhtml')
+	assert len(first) > zen_core.max_template_size
+	
+	hits = parse_hits()
+	for i in range(3):
+		assert zen_core.expand_abbreviation(abbr, 'html', 'xhtml') == first
+	
+	assert parse_hits() == hits + 3
+
+def test_repeated_expansion_uses_template():
+	zen_core.invalidate_caches()
+	zen_core.expand_abbreviation('div#page>p.text*2', 'html', 'xhtml')
+	stats = zen_core.cache_stats()
+	for i in range(3):
+		zen_core.expand_abbreviation('div#page>p.text*2', 'html', 'xhtml')
+	
+	assert zen_core.cache_stats()['template']['hits'] == stats['template']['hits'] + 3
+	assert zen_core.cache_stats()['parse']['misses'] == stats['parse']['misses']
@@ -0,0 +1,18 @@
+'''
+Resource lookups with respect of syntax inheritance
+'''
+from zencoding import zen_core
+
+def test_get_resource_returns_nearest_collection():
+	settings = zen_core.get_context().settings
+	assert zen_core.get_resource('xsl', 'abbreviations') is settings['xsl']['abbreviations']
+	assert zen_core.get_resource('haml', 'snippets') is settings['html']['snippets']
+	assert zen_core.get_resource('haml', 'filters') == settings['haml']['filters']
+	assert zen_core.get_resource('css', 'abbreviations') is None
+	assert zen_core.get_resource('unknown', 'snippets') is None
+
+def test_settings_resource_follows_inheritance():
+	settings = zen_core.get_context().settings
+	assert 'a' not in settings['xsl']['abbreviations']
+	assert zen_core.get_settings_resource('xsl', 'a', 'abbreviations') is not None
+	assert zen_core.get_settings_resource('haml', 'cc:ie', 'snippets') == settings['html']['snippets']['cc:ie']
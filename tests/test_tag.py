@@ -0,0 +1,25 @@
+'''
+Attributes added to parsed tags one by one
+'''
+from zencoding import zen_core
+
+def test_add_attribute_merges_with_defaults():
+	tag = zen_core.Tag('a')
+	tag.add_attribute('href', 'http://example.com')
+	tag.add_attribute('class', 'a')
+	tag.add_attribute('title', 'x')
+	tag.add_attribute('class', 'b')
+	tag.add_attribute('title', 'y')
+	assert tag.attributes == [
+		{'name': 'href', 'value': 'http://example.com'},
+		{'name': 'class', 'value': 'a b'},
+		{'name': 'title', 'value': 'y'}
+	]
+
+def test_add_many_attributes():
+	tag = zen_core.Tag('div')
+	for i in range(10000):
+		tag.add_attribute('data-a%d' % (i % 5000), str(i))
+	
+	assert len(tag.attributes) == 5000
+	assert tag.attributes[0] == {'name': 'data-a0', 'value': '5000'}
@@ -1,3 +1,7 @@
 # And away we go...
-from .plugin import ZenCodingPlugin
+import sys
 
+# Gedit loads gi before plugins; without it (command line, worker processes,
+# other scripts) zen_core and friends are used as a library
+if 'gi' in sys.modules:
+	from .plugin import ZenCodingPlugin
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Command line interface to Zen Coding. Doesn't need Gedit: only core, 
+settings parser and filters are loaded.
+
+@example
+echo 'ul#nav>li*3>a' | python -m zencoding expand --profile xhtml
+python -m zencoding expand --syntax css --filters fc abbrs.txt
+echo '{"id": 1, "abbr": "p.note"}' | python -m zencoding expand --jsonl
+python -m zencoding serve --socket /tmp/zc.sock
+
+In plain mode each non-empty input line is an abbreviation and its 
+expansion is written to stdout as soon as it's ready, followed by newline.
+In JSON Lines mode each input line is a JSON string (abbreviation) or 
+object with 'abbr' key and optional 'syntax', 'profile' and 'filters' keys;
+for each line the same object with 'result' (or 'error') key is written.
+
+The 'serve' command starts expansion daemon (see zen_daemon.py).
+'''
+import sys
+import argparse
+
+from . import zen_core
+
+def create_parser():
+	"""
+	Creates command line arguments parser
+	@return: argparse.ArgumentParser
+	"""
+	parser = argparse.ArgumentParser(prog='python -m zencoding',
+			description='Zen Coding abbreviation expander')
+	commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+	commands.required = True
+	
+	expand = commands.add_parser('expand', help='expand abbreviations, one per line')
+	expand.add_argument('files', nargs='*', metavar='FILE',
+			help='files with abbreviations (default: standard input)')
+	expand.add_argument('-s', '--syntax', default='html',
+			help='document syntax: html, css, xsl, haml, etc. (default: %(default)s)')
+	expand.add_argument('-p', '--profile', default='xhtml', choices=sorted(zen_core.profiles),
+			help='output profile: xhtml, html, xml or plain (default: %(default)s)')
+	expand.add_argument('-f', '--filters', default='',
+			help='additional filters, comma-separated (like "c,e")')
+	expand.add_argument('--caret', default='',
+			help='caret placeholder inserted into output (default: empty)')
+	expand.add_argument('--jsonl', action='store_true',
+			help='read and write JSON Lines')
+	expand.set_defaults(func=expand_command)
+	
+	serve = commands.add_parser('serve', help='run expansion daemon on Unix socket')
+	serve.add_argument('--socket', metavar='PATH',
+			help='socket path (default: zencoding.sock in runtime or temp dir)')
+	serve.add_argument('--max-clients', type=int, default=16,
+			help='maximum number of connected clients (default: %(default)s)')
+	serve.add_argument('--caret', default='',
+			help='caret placeholder inserted into output (default: empty)')
+	serve.set_defaults(func=serve_command)
+	
+	return parser
+
+class CommandError(Exception):
+	"""
+	Command can't be completed, message is reported to user
+	"""
+
+def read_lines(files):
+	"""
+	Generates lines from files or standard input if no files given
+	@type files: list
+	@raise CommandError: File can't be read
+	"""
+	if not files:
+		for line in sys.stdin:
+			yield line
+		return
+	
+	for name in files:
+		if name == '-':
+			for line in sys.stdin:
+				yield line
+		else:
+			try:
+				with open(name, encoding='utf-8') as f:
+					for line in f:
+						yield line
+			except (OSError, UnicodeDecodeError) as e:
+				raise CommandError("can't read %s: %s" % (name, getattr(e, 'strerror', None) or e))
+
+def add_filters(abbr, filters):
+	"""
+	Appends filters to abbreviation
+	@param filters: Comma- or pipe-separated filter list
+	@type filters: str
+	@return: str
+	"""
+	filters = [f.strip() for f in filters.replace(',', '|').split('|') if f.strip()]
+	return '|'.join([abbr] + filters) if filters else abbr
+
+def expand_command(options, output):
+	"""
+	Expands abbreviations according to parsed command line options
+	"""
+	zen_core.set_caret_placeholder(options.caret)
+	lines = read_lines(options.files)
+	
+	if options.jsonl:
+		return expand_jsonl(lines, options, output)
+	
+	write = output.write
+	for line in lines:
+		abbr = line.strip()
+		if abbr:
+			for chunk in zen_core.iter_expand_abbreviation(add_filters(abbr, options.filters),
+					options.syntax, options.profile):
+				write(chunk)
+			write('\n')
+	
+	return 0
+
+def expand_jsonl(lines, options, output):
+	"""
+	Expands abbreviations in JSON Lines mode
+	"""
+	import json
+	
+	status = 0
+	for line in lines:
+		if not line.strip():
+			continue
+		
+		try:
+			item = json.loads(line)
+		except ValueError as e:
+			output.write(json.dumps({'error': 'Invalid JSON: %s' % e}) + '\n')
+			status = 1
+			continue
+		
+		if not isinstance(item, dict):
+			item = {'abbr': item}
+		
+		abbr = item.get('abbr')
+		profile = item.get('profile') or options.profile
+		if not isinstance(abbr, str):
+			item['error'] = 'No abbreviation'
+			status = 1
+		elif not isinstance(profile, str) or profile not in zen_core.get_context().profiles:
+			item['error'] = 'Unknown profile: %s' % (profile,)
+			status = 1
+		else:
+			abbr = add_filters(abbr, item.get('filters') or options.filters)
+			try:
+				item['result'] = zen_core.expand_abbreviation(abbr,
+						item.get('syntax') or options.syntax, profile)
+			except Exception as e:
+				item['error'] = 'Expansion failed: %s' % e
+				status = 1
+		
+		output.write(json.dumps(item) + '\n')
+	
+	return status
+
+def serve_command(options, output):
+	"""
+	Runs expansion daemon
+	"""
+	from . import zen_daemon
+	
+	zen_core.set_caret_placeholder(options.caret)
+	server = zen_daemon.Server(options.socket, options.max_clients)
+	
+	def on_ready():
+		output.write('Serving on %s\n' % server.path)
+		output.flush()
+	
+	try:
+		server.run(on_ready)
+	except zen_daemon.DaemonError as e:
+		sys.stderr.write('%s\n' % e)
+		return 1
+	return 0
+
+def main(args=None):
+	"""
+	Command line entry point
+	@param args: Command line arguments, <code>sys.argv[1:]</code> by default
+	@type args: list
+	@return: Exit status
+	"""
+	parser = create_parser()
+	options = parser.parse_args(args)
+	try:
+		return options.func(options, sys.stdout)
+	except CommandError as e:
+		sys.stdout.flush()
+		parser.exit(1, '%s: error: %s\n' % (parser.prog, e))
+	finally:
+		sys.stdout.flush()
+
+if __name__ == '__main__':
+	sys.exit(main())
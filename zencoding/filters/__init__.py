@@ -1,23 +1,156 @@
-import os.path
-import sys
-
-# import all filters
-__sub_modules = []
-__prefix = 'zencoding.filters'
-__filter_dir = os.path.dirname(__file__)
-sys.path.append(__filter_dir)
-
-filter_map = {}
-for file in os.listdir(__filter_dir):
-	name, ext = os.path.splitext(file)
-	if ext.lower() == '.py':
-		__sub_modules.append(name)
-		
-__filters = __import__(__prefix, globals(), locals(), __sub_modules)
-for key in dir(__filters):
-	__module = getattr(__filters, key)
-	if hasattr(__module, '__name__') and __module.__name__.startswith(__prefix + '.') and hasattr(__module, 'process'):
-		if hasattr(__module, 'alias'):
-			filter_map[__module.alias] = __module.process
+'''
+Registry of Zen Coding output filters.
+
+Filter modules are imported on first use. Besides built-in filters,
+third-party packages may provide filters through 'zencoding.filters' entry
+point group: entry point name is filter name, value is filter module path.
+
+@example
+# setup.py of third-party package
+entry_points={'zencoding.filters': ['jade = zenjade.filter']}
+'''
+import importlib
+
+entry_point_group = 'zencoding.filters'
+
+builtin_filters = {
+	'_format': '.format',
+	'c': '.comment',
+	'e': '.escape',
+	'fc': '.format-css',
+	'haml': '.haml',
+	'html': '.html',
+	'xsl': '.xsl'
+}
+"Filter name -> module path of bundled filters"
+
+def iter_entry_points(group):
+	"""
+	Returns installed entry points of <code>group</code>
+	@type group: str
+	@return: list
+	"""
+	try:
+		from importlib import metadata
+	except ImportError:
+		return []
+
+	try:
+		return list(metadata.entry_points(group=group))
+	except TypeError:
+		# Python < 3.10
+		return list(metadata.entry_points().get(group, []))
+
+class FilterRegistry(object):
+	"""
+	Filter name -> module map that imports filter module when filter is
+	first requested
+	"""
+	def __init__(self, paths=None):
+		"""
+		@param paths: Filter name -> module path (relative to this package
+		or absolute) map
+		@type paths: dict
+		"""
+		self.paths = dict(paths or {})
+		self.modules = {}
+		self._entry_points_loaded = False
+
+	def register(self, name, module):
+		"""
+		Registers filter. If filter was already imported, it will be
+		replaced; cached filter chains should be invalidated with
+		<code>zen_core.invalidate_caches()</code>
+		@param name: Filter name
+		@type name: str
+		@param module: Filter module or its path
+		@type module: module, str
+		"""
+		if isinstance(module, str):
+			self.paths[name] = module
+			self.modules.pop(name, None)
+		else:
+			self.modules[name] = module
+
+	def get(self, name, default=None):
+		"""
+		Returns filter module by its name, or <code>default</code> if there's
+		no such filter
+		"""
+		module = self.modules.get(name)
+		if module is not None:
+			return module
+
+		if name not in self.paths:
+			self.load_entry_points()
+
+		path = self.paths.get(name)
+		if path is None:
+			return default
+
+		if isinstance(path, str):
+			module = importlib.import_module(path, __name__)
 		else:
-			filter_map[__module.__name__[len(__prefix) + 1:]] = __module.process
+			module = path.load()
+
+		self.modules[name] = module
+		return module
+
+	def load_entry_points(self):
+		"""
+		Adds filters from entry points of installed packages. Bundled and
+		explicitly registered filters are not overridden
+		"""
+		if self._entry_points_loaded:
+			return
+
+		self._entry_points_loaded = True
+		for entry_point in iter_entry_points(entry_point_group):
+			if entry_point.name not in self.paths and entry_point.name not in self.modules:
+				self.paths[entry_point.name] = entry_point
+
+	def names(self):
+		"""
+		Returns names of all available filters
+		@return: list
+		"""
+		self.load_entry_points()
+		return sorted(set(self.paths) | set(self.modules))
+
+	def __contains__(self, name):
+		return self.get(name) is not None
+
+	def __getitem__(self, name):
+		module = self.get(name)
+		if module is None:
+			raise KeyError(name)
+		return module
+
+class _ProcessMap(object):
+	"""
+	Read-only filter name -> process function view of registry
+	"""
+	def __init__(self, registry):
+		self.registry = registry
+
+	def get(self, name, default=None):
+		module = self.registry.get(name)
+		return module.process if module is not None else default
+
+	def __contains__(self, name):
+		return name in self.registry
+
+	def __getitem__(self, name):
+		return self.registry[name].process
+
+filter_modules = FilterRegistry(builtin_filters)
+"Filter name -> module map"
+
+filter_map = _ProcessMap(filter_modules)
+"Filter name -> process function map"
+
+def register_filter(name, module):
+	"""
+	Registers filter module, see <code>FilterRegistry.register()</code>
+	"""
+	filter_modules.register(name, module)
@@ -31,17 +31,31 @@ def add_comments(node, i):
 		node.start = node.start.replace('<', '<!-- ' + comment_str + ' -->' + nl + padding + '<', 1)
 		node.end = node.end.replace('>', '>' + nl + padding + '<!-- /' + comment_str + ' -->', 1)
 		
-		# replace counters
-		node.start = zen_coding.replace_counter(node.start, i + 1)
-		node.end = zen_coding.replace_counter(node.end, i + 1)
+		# replace counters (repeated nodes get them replaced on output)
+		if node.repeat == 1:
+			node.start = zen_coding.replace_counter(node.start, i + 1)
+			node.end = zen_coding.replace_counter(node.end, i + 1)
+
+_positions = {}
+"Number of already visited (expanded) children of each parent node"
+
+def begin(tree, profile):
+	_positions.clear()
+	# comments are placed on separate lines
+	return profile['tag_nl'] is not False
+
+def enter(item, profile, level):
+	# comments are numbered by node position among its expanded siblings,
+	# siblings are visited in order so running sum of their repeats is used
+	key = id(item.parent)
+	i = _positions.get(key, 0)
+	_positions[key] = i + item.repeat
+	if item.is_block():
+		add_comments(item, i)
 
 def process(tree, profile):
-	if profile['tag_nl'] is False:
-		return tree
-		
-	for i, item in enumerate(tree.children):
-		if item.is_block():
-			add_comments(item, i)
-		process(item, profile)
+	if begin(tree, profile):
+		zen_coding.run_hooks(tree, profile, [enter])
+		_positions.clear()
 	
 	return tree
\ No newline at end of file
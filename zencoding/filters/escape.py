@@ -7,6 +7,7 @@ Filter for escaping unsafe XML characters: <, >, &
 @link http://chikuyonok.ru
 '''
 import re
+from zencoding import zen_core as zen_coding
 
 alias = 'e'
 "Filter name alias (if not defined, ZC will use module name)"
@@ -22,11 +23,10 @@ re_chars = re.compile(r'[<>&]')
 def escape_chars(text):
 	return re_chars.sub(lambda m: char_map[m.group(0)], text)
 
+def enter(item, profile, level):
+	item.start = escape_chars(item.start)
+	item.end = escape_chars(item.end)
+
 def process(tree, profile=None):
-	for item in tree.children:
-		item.start = escape_chars(item.start)
-		item.end = escape_chars(item.end)
-		
-		process(item)
-	
+	zen_coding.run_hooks(tree, profile, [enter])
 	return tree
\ No newline at end of file
@@ -32,7 +32,7 @@ def has_block_sibling(item):
 	@type item: ZenNode
 	@return: bool
 	"""
-	return item.parent and item.parent.has_block_children()
+	return item.parent and item.parent.get_layout() & zen_coding.LAYOUT_BLOCK_CHILDREN
 
 def is_very_first_child(item):
 	"""
@@ -50,25 +50,10 @@ def should_break_line(node, profile):
 	"""
 	if not profile['inline_break']:
 		return False
-		
-	# find toppest non-inline sibling
-	while node.previous_sibling and node.previous_sibling.is_inline():
-		node = node.previous_sibling
-	
-	if not node.is_inline():
-		return False
-		
-	# calculate how many inline siblings we have
-	node_count = 1
-	node = node.next_sibling
-	while node:
-		if node.is_inline():
-			node_count += 1
-		else:
-			break
-		node = node.next_sibling
 	
-	return node_count >= profile['inline_break']
+	# size of inline run is zero for non-inline node
+	run = node.get_inline_run()
+	return run > 0 and run >= profile['inline_break']
 
 def should_break_child(node, profile):
 	"""
@@ -78,7 +63,7 @@ def should_break_child(node, profile):
 	 @return: bool
 	"""
 	# we need to test only one child element, because 
-	# has_block_children() method will do the rest
+	# block children facts will do the rest
 	return node.children and should_break_line(node.children[0], profile)
 
 def process_snippet(item, profile, level=0):
@@ -139,6 +124,7 @@ def process_tag(item, profile, level=0):
 		padding = item.parent.padding if item.parent else get_indentation() * level
 		force_nl = profile['tag_nl'] is True
 		should_break = should_break_line(item, profile)
+		layout = item.get_layout()
 		
 		# formatting block-level elements
 		if ((item.is_block() or should_break) and item.parent) or force_nl:
@@ -146,10 +132,10 @@ def process_tag(item, profile, level=0):
 			if not item.parent or (item.parent.type != 'snippet' and not is_very_first_child(item)):
 				item.start = get_newline() + padding + item.start
 				
-			if item.has_block_children() or should_break_child(item, profile) or (force_nl and not is_unary):
+			if layout & zen_coding.LAYOUT_BLOCK_CHILDREN or should_break_child(item, profile) or (force_nl and not is_unary):
 				item.end = get_newline() + padding + item.end
 				
-			if item.has_tags_in_content() or (force_nl and not item.has_children() and not is_unary):
+			if layout & zen_coding.LAYOUT_TAGS_IN_CONTENT or (force_nl and not item.has_children() and not is_unary):
 				item.start += get_newline() + padding + get_indentation()
 			
 		elif item.is_inline() and has_block_sibling(item) and not is_very_first_child(item):
@@ -159,6 +145,30 @@ def process_tag(item, profile, level=0):
 	
 	return item
 
+def begin(tree, profile):
+	"""
+	Prepares tree for formatting
+	@type tree: ZenNode
+	@type profile: dict
+	"""
+	zen_coding.compute_layout(tree)
+
+def enter(item, profile, level):
+	"""
+	Formats single tree node
+	@type item: ZenNode
+	@type profile: dict
+	@param level: Depth level
+	@type level: int
+	"""
+	if item.type == 'tag':
+		item = process_tag(item, profile, level)
+	else:
+		item = process_snippet(item, profile, level)
+	
+	if item.content:
+		item.content = zen_coding.pad_string(item.content, item.padding)
+
 def process(tree, profile, level=0):
 	"""
 	Processes simplified tree, making it suitable for output as HTML structure
@@ -167,16 +177,6 @@ def process(tree, profile, level=0):
 	@param level: Depth level
 	@type level: int
 	"""
-	
-	for item in tree.children:
-		if item.type == 'tag':
-			item = process_tag(item, profile, level)
-		else:
-			item = process_snippet(item, profile, level)
-		
-		if item.content:
-			item.content = zen_coding.pad_string(item.content, item.padding)
-			
-		process(item, profile, level + 1)
-	
+	begin(tree, profile)
+	zen_coding.run_hooks(tree, profile, [enter], level=level)
 	return tree
\ No newline at end of file
@@ -68,7 +68,7 @@ def has_block_sibling(item):
 	@type item: ZenNode
 	@return: bool
 	"""
-	return item.parent and item.parent.has_block_children()
+	return item.parent and item.parent.get_layout() & zen_coding.LAYOUT_BLOCK_CHILDREN
 
 def process_tag(item, profile, level):
 	"""
@@ -110,6 +110,38 @@ def process_tag(item, profile, level):
 	
 	return item
 
+requires = '_format'
+"Tree should be preformatted"
+
+def begin(tree, profile):
+	"""
+	Creates tabstop registry of expansion
+	@type tree: ZenNode
+	@type profile: dict
+	"""
+	tree.tabstops = zen_coding.TabstopRegistry()
+
+def enter(item, profile, level):
+	"""
+	Outputs single tree node as HTML
+	@type item: ZenNode
+	@type profile: dict
+	@type level: int
+	"""
+	if item.type == 'tag':
+		process_tag(item, profile, level)
+	else:
+		process_snippet(item, profile, level)
+
+	# replace counters (repeated nodes get them replaced on output)
+	if item.repeat == 1:
+		item.start = zen_coding.fill_counter(item.start, item.counter)
+		item.end = zen_coding.fill_counter(item.end, item.counter)
+	
+	# registry is shared by all nodes of expansion
+	item.tabstops = item.parent.tabstops or zen_coding.TabstopRegistry()
+	item.tabstops.upgrade(item)
+
 def process(tree, profile, level=0):
 	"""
 	Processes simplified tree, making it suitable for output as HTML structure
@@ -120,19 +152,7 @@ def process(tree, profile, level=0):
 	if level == 0:
 		# preformat tree
 		tree = zen_coding.run_filters(tree, profile, '_format')
-		zen_coding.max_tabstop = 0
-		
-	for item in tree.children:
-		if item.type == 'tag':
-			process_tag(item, profile, level)
-		else:
-			process_snippet(item, profile, level)
+		begin(tree, profile)
 	
-		# replace counters
-		item.start = zen_coding.unescape_text(zen_coding.replace_counter(item.start, item.counter))
-		item.end = zen_coding.unescape_text(zen_coding.replace_counter(item.end, item.counter))
-		zen_coding.upgrade_tabstops(item)
-		
-		process(item, profile, level + 1)
-		
+	zen_coding.run_hooks(tree, profile, [enter], level=level)
 	return tree
@@ -8,6 +8,7 @@ child elements
 @link http://chikuyonok.ru
 '''
 import re
+from zencoding import zen_core as zen_coding
 
 tags = {
 	'xsl:variable': 1,
@@ -23,9 +24,10 @@ def trim_attribute(node):
 	"""
 	node.start = re_attr.sub('', node.start)
 
+def enter(item, profile, level):
+	if item.type == 'tag' and item.name.lower() in tags and item.children:
+		trim_attribute(item)
+
 def process(tree, profile):
-	for item in tree.children:
-		if item.type == 'tag' and item.name.lower() in tags and item.children:
-			trim_attribute(item)
-		
-		process(item, profile)
\ No newline at end of file
+	zen_coding.run_hooks(tree, profile, [enter])
+	return tree
@@ -4,19 +4,43 @@ Created on Jun 14, 2009
 
 @author: Sergey Chikuyonok (http://chikuyonok.ru)
 '''
-from copy import deepcopy
-
 import re
+import sys
 import types
 from .zen_settings import zen_settings
 
-_original_settings = deepcopy(zen_settings)
+def copy_settings(obj):
+	"""
+	Creates deep copy of raw settings data. Much faster than 
+	<code>copy.deepcopy()</code> since settings contain only dicts, lists 
+	and immutable values
+	@type obj: dict
+	@return: dict
+	"""
+	if isinstance(obj, dict):
+		return dict([(k, copy_settings(v)) for k, v in obj.items()])
+	elif isinstance(obj, list):
+		return [copy_settings(v) for v in obj]
+	return obj
+
+_original_settings = copy_settings(zen_settings)
 
 TYPE_ABBREVIATION = 'zen-tag',
 TYPE_EXPANDO = 'zen-expando',
 TYPE_REFERENCE = 'zen-reference';
 """ Reference to another abbreviation or tag """
 
+ELEMENT_EMPTY = 1
+ELEMENT_BLOCK = 2
+ELEMENT_INLINE = 4
+"Element classification flags, see <code>create_element_flags()</code>"
+
+element_type_flags = {
+	'empty': ELEMENT_EMPTY,
+	'block_level': ELEMENT_BLOCK,
+	'inline_level': ELEMENT_INLINE
+}
+
 re_tag = r'^<([\w\-]+(?:\:[\w\-]+)?)((?:\s+[\w\-]+(?:\s*=\s*(?:(?:"[^"]*")|(?:\'[^\']*\')|[^>\s]+))?)*)\s*(\/?)>'
 "Regular expression for XML tag matching"
 	
@@ -27,6 +51,8 @@ class Entry:
 	"""
 	Unified object for parsed data
 	"""
+	__slots__ = ('type', 'key', 'value')
+	
 	def __init__(self, entry_type, key, value):
 		"""
 		@type entry_type: str
@@ -133,10 +159,37 @@ def create_maps(obj):
 		if p == 'element_types':
 			for k, v in list(value.items()):
 				if isinstance(v, str):
-					value[k] = [el.strip() for el in v.split(',')]
+					v = v.split(',')
+				value[k] = set([sys.intern(el.strip()) for el in v])
 		elif type(value) == dict:
 			create_maps(value)
 
+def create_element_flags(obj):
+	"""
+	Builds element classification table for each syntax section with
+	<code>element_types</code>: a dictionary of tag name and bit mask of
+	<code>ELEMENT_*</code> flags, so element type is tested with a single
+	lookup
+	@type obj: dict
+	"""
+	for value in obj.values():
+		if type(value) == dict and 'element_types' in value:
+			value['element_flags'] = get_element_flags_table(value['element_types'])
+
+def get_element_flags_table(element_types):
+	"""
+	Returns classification table for <code>element_types</code> collection
+	@type element_types: dict
+	@return: dict
+	"""
+	table = {}
+	for k, names in element_types.items():
+		flag = element_type_flags.get(k, 0)
+		for name in names:
+			table[name] = table.get(name, 0) | flag
+	
+	return table
+
 
 if __name__ == '__main__':
 	pass
@@ -146,16 +199,17 @@ def get_settings(user_settings=None):
 	Main function that gather all settings and returns parsed dictionary
 	@param user_settings: A dictionary of user-defined settings
 	"""
-	settings = deepcopy(_original_settings)
+	settings = copy_settings(_original_settings)
 	create_maps(settings)
 	
 	if user_settings:
-		user_settings = deepcopy(user_settings)
+		user_settings = copy_settings(user_settings)
 		create_maps(user_settings)
 		extend(settings, user_settings)
 	
 	# now we need to parse final set of settings
 	parse(settings)
+	create_element_flags(settings)
 	
 	return settings
 	
@@ -48,9 +48,10 @@ def expand_abbreviation(editor, syntax=None, profile_name=None):
 	content = ''
 		
 	if abbr:
-		content = zen_coding.expand_abbreviation(abbr, syntax, profile_name)
+		padding = get_current_line_padding(editor)
+		content = zen_coding.expand_abbreviation(abbr, syntax, profile_name, padding)
 		if content:
-			editor.replace_content(content, caret_pos - len(abbr), caret_pos)
+			editor.replace_content(content, caret_pos - len(abbr), caret_pos, indented=True)
 			return True
 	
 	return False
@@ -179,10 +180,10 @@ def wrap_with_abbreviation(editor, abbr, syntax=None, profile_name=None):
 	padding = get_line_padding(content[line_bounds[0]:line_bounds[1]])
 	
 	new_content = content[start_offset:end_offset]
-	result = zen_coding.wrap_with_abbreviation(abbr, unindent_text(new_content, padding), syntax, profile_name)
+	result = zen_coding.wrap_with_abbreviation(abbr, unindent_text(new_content, padding), syntax, profile_name, padding)
 	
 	if result:
-		editor.replace_content(result, start_offset, end_offset)
+		editor.replace_content(result, start_offset, end_offset, indented=True)
 		return True
 	
 	return False
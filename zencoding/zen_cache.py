@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Small bounded caches used by Zen Coding to keep results of expensive
+operations (like abbreviation parsing) between calls.
+
+@example
+cache = LRUCache(100)
+cache.set('key', 'value')
+cache.get('key') # 'value'
+cache.stats()    # {'hits': 1, 'misses': 0, 'size': 1, 'max_size': 100}
+'''
+from collections import OrderedDict
+import threading
+
+class LRUCache(object):
+	"""
+	Dictionary-like cache that holds at most <code>max_size</code> items. When
+	cache is full, the least recently used item is dropped
+	"""
+	def __init__(self, max_size=128):
+		"""
+		@param max_size: Maximum number of items in cache
+		@type max_size: int
+		"""
+		self.max_size = max_size
+		self.hits = 0
+		self.misses = 0
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key, default=None):
+		"""
+		Returns cached value for <code>key</code>, or <code>default</code> if
+		there's no such item in cache
+		"""
+		with self._lock:
+			try:
+				value = self._data[key]
+			except KeyError:
+				self.misses += 1
+				return default
+
+			self._data.move_to_end(key)
+			self.hits += 1
+			return value
+
+	def set(self, key, value):
+		"""
+		Puts value into cache, dropping the least recently used item if
+		cache is full
+		"""
+		with self._lock:
+			self._data[key] = value
+			self._data.move_to_end(key)
+			while len(self._data) > self.max_size:
+				self._data.popitem(last=False)
+
+	def clear(self):
+		"""
+		Removes all items from cache and resets hit/miss counters
+		"""
+		with self._lock:
+			self._data.clear()
+			self.hits = 0
+			self.misses = 0
+
+	def stats(self):
+		"""
+		Returns cache usage statistics
+		@return: dict
+		"""
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'size': len(self._data),
+			'max_size': self.max_size
+		}
+
+	def __len__(self):
+		return len(self._data)
+
+	def __contains__(self, key):
+		return key in self._data
@@ -27,17 +27,21 @@ Created on Apr 17, 2009
 from .zen_settings import zen_settings
 import re
 from . import stparser
-import collections
-
-newline = '\n'
-"Newline symbol"
-
-caret_placeholder = '{%::zen-caret::%}'
+from .zen_cache import LRUCache
+import copy
+import itertools
+import os
+import threading
+import warnings
 
 default_tag = 'div'
 
 re_tag = re.compile(r'<\/?[\w:\-]+(?:\s+[\w\-:]+(?:\s*=\s*(?:(?:"[^"]*")|(?:\'[^\']*\')|[^>\s]+))?)*\s*(\/?)>$')
 
+LAYOUT_TAGS_IN_CONTENT = 1
+LAYOUT_BLOCK_CHILDREN = 2
+"Layout facts of ZenNode, see <code>compute_layout()</code>"
+
 profiles = {}
 "Available output profiles"
 
@@ -61,8 +65,239 @@ default_profile = {
 basic_filters = 'html';
 "Filters that will be applied for unknown syntax"
 
-max_tabstop = 0
-"Maximum tabstop index for current session"
+max_tag_lookback = 4096
+"""How many characters before '>' are examined to find out if it closes
+XHTML tag (see <code>ends_with_tag_at()</code>)"""
+
+lazy_repeat_threshold = 100
+"""Multiplied elements with larger count are represented by a single lazy
+node in rolled out tree (see <code>ZenNode.repeat</code>)"""
+
+parse_cache = LRUCache(256)
+"Parsed abbreviation trees, keyed by abbreviation, syntax and context generation"
+
+template_cache = LRUCache(256)
+"Compiled abbreviations, keyed by abbreviation, syntax, profile and context generation"
+
+max_template_size = 65536
+"Compiled abbreviations with larger output are not cached"
+
+min_pool_batch = 4096
+"""Smaller batches are expanded by <code>expand_many()</code> in current 
+process: starting worker processes would take longer than expansion"""
+
+counter_cache = LRUCache(1024)
+"Counter templates of output strings, keyed by string"
+
+filter_cache = LRUCache(256)
+"Compiled filter chains, keyed by filter list or syntax and context generation"
+
+_reported_filters = set()
+
+_missing = object()
+
+re_variable = re.compile(r'\$\{([\w\-]+)\}')
+
+re_escaped_char = re.compile(r'\\(.)')
+
+re_tabstop = re.compile(r'\$(\d+)|\$\{(\d+):([^\}]+)\}')
+"Tabstops in output strings: $1 or ${1:placeholder}"
+
+_generations = itertools.count(1)
+_active = threading.local()
+
+class ExpansionContext(object):
+	"""
+	State used for expanding abbreviations: settings, variables, output 
+	profiles, newline and caret placeholder. Module-level functions work 
+	with context which is active in current thread (see 
+	<code>get_context()</code>), so separate contexts allow expanding 
+	abbreviations for documents with different settings in parallel.
+	
+	@example
+	ctx = ExpansionContext(newline='\r\n', variables={'indentation': '  '})
+	with ctx:
+		expand_abbreviation('ul>li*2', 'html', 'xhtml')
+	"""
+	def __init__(self, settings=None, variables=None, newline='\n',
+			caret_placeholder='{%::zen-caret::%}', profiles=None):
+		"""
+		@param settings: Zen Coding settings (see zen_settings.py), settings
+		of default context if omitted. Default context parses settings from
+		zen_settings.py on first use
+		@type settings: dict
+		@param variables: Variables that override values from settings
+		@type variables: dict
+		@param newline: Newline symbol
+		@type newline: str
+		@param caret_placeholder: Caret placeholder, string or function
+		@param profiles: Output profiles, shared module profiles if omitted
+		@type profiles: dict
+		"""
+		if settings is None and default_context is not None:
+			settings = default_context.settings
+		
+		self.settings = settings
+		"Zen Coding settings; re-assign or call <code>invalidate_caches()</code> when changed"
+		
+		self.variables = dict(variables or {})
+		
+		self.variable_versions = {}
+		"""Variable name -> unique number of its value, changed each time
+		variable is set to a new value"""
+		
+		self.newline = newline
+		self.caret_placeholder = caret_placeholder
+		self.profiles = profiles if profiles is not None else globals()['profiles']
+		
+		self.generation = next(_generations)
+		"""Unique number of context state, changed each time settings or 
+		caret placeholder are changed. Used in cache keys. Expansions 
+		don't depend on variables: they are bound on output"""
+	
+	@property
+	def settings(self):
+		if self._settings is None:
+			# default settings are parsed on first use
+			update_settings(stparser.get_settings(), self)
+		return self._settings
+	
+	@settings.setter
+	def settings(self, value):
+		self._settings = value
+		self._resources = {}
+	
+	def get_resource_index(self, syntax, name):
+		"""
+		Returns resource of syntax with inheritance chain already resolved.
+		Dictionary resources (like abbreviations and snippets) of syntax and
+		its ancestors are merged into a single dictionary, so any lookup is a
+		single dict hit; abbreviation references are dereferenced. Results
+		are kept until context settings are changed
+		@param syntax: Syntax name
+		@type syntax: str
+		@param name: Resource name
+		@type name: str
+		@return: dict, str or None
+		"""
+		key = (syntax, name)
+		try:
+			return self._resources[key]
+		except KeyError:
+			value = _resolve_resource(self.settings, syntax, name)
+			self._resources[key] = value
+			return value
+	
+	def settings_changed(self):
+		"""
+		Must be called when context settings were changed in place: drops
+		resolved resources and outdates cached data
+		"""
+		self._resources = {}
+		self.touch()
+	
+	def touch(self):
+		"""
+		Marks context state as changed, which outdates all cached data 
+		(like parsed abbreviations) produced with this context
+		"""
+		self.generation = next(_generations)
+	
+	def derive(self, **options):
+		"""
+		Creates copy of current context with some options changed.
+		Variables passed in <code>variables</code> option are added to
+		current ones
+		@return: ExpansionContext
+		"""
+		variables = dict(self.variables)
+		variables.update(options.pop('variables', {}))
+		params = {
+			'settings': self.settings,
+			'newline': self.newline,
+			'caret_placeholder': self.caret_placeholder,
+			'profiles': self.profiles
+		}
+		params.update(options)
+		context = ExpansionContext(variables=variables, **params)
+		if context.settings is self.settings:
+			context._resources = self._resources
+		return context
+	
+	def get_variable(self, name):
+		"""
+		Returns variable value: context's own value or the one from settings
+		@return: str
+		"""
+		if name in self.variables:
+			return self.variables[name]
+		
+		variables = self.settings.get('variables')
+		if variables and name in variables:
+			return variables[name]
+		return None
+	
+	def get_variable_version(self, name):
+		"""
+		Returns unique number of variable's current value; zero if variable
+		was never set in this context
+		@return: int
+		"""
+		return self.variable_versions.get(name, 0)
+	
+	def set_variable(self, name, value):
+		"""
+		Set context variable value
+		"""
+		if self.get_variable(name) != value:
+			self.variables[name] = value
+			self.variable_versions[name] = next(_generations)
+	
+	def expand_abbreviation(self, abbr, syntax='html', profile_name='plain', base_indent=''):
+		"""
+		Expands abbreviation within this context
+		@return: str
+		"""
+		with self:
+			return expand_abbreviation(abbr, syntax, profile_name, base_indent)
+	
+	def wrap_with_abbreviation(self, abbr, text, doc_type='html', profile='plain', base_indent=''):
+		"""
+		Wraps text with abbreviation within this context
+		@return: str
+		"""
+		with self:
+			return wrap_with_abbreviation(abbr, text, doc_type, profile, base_indent)
+	
+	def __enter__(self):
+		stack = getattr(_active, 'stack', None)
+		if stack is None:
+			stack = _active.stack = []
+		stack.append(activate_context(self))
+		return self
+	
+	def __exit__(self, *args):
+		activate_context(_active.stack.pop())
+
+default_context = None
+
+def get_context():
+	"""
+	Returns expansion context which is active in current thread
+	@return: ExpansionContext
+	"""
+	return getattr(_active, 'context', None) or default_context
+
+def activate_context(context):
+	"""
+	Makes <code>context</code> active in current thread. Pass 
+	<code>None</code> to get back to default context
+	@type context: ExpansionContext
+	@return: Previously active context
+	"""
+	previous = get_context()
+	_active.context = context
+	return previous
 
 def char_at(text, pos):
 	"""
@@ -126,11 +361,12 @@ def make_map(prop):
 	@param prop: Key name in <code>zen_settings['html']</code> dictionary
 	@type prop: str
 	"""
+	settings = get_context().settings
 	obj = {}
-	for a in zen_settings['html'][prop].split(','):
+	for a in settings['html'][prop].split(','):
 		obj[a] = True
 		
-	zen_settings['html'][prop] = obj
+	settings['html'][prop] = obj
 
 def create_profile(options):
 	"""
@@ -158,14 +394,13 @@ def get_newline():
 	redefined to return current editor's settings 
 	@return: str
 	"""
-	return newline
+	return get_context().newline
 
 def set_newline(char):
 	"""
 	Sets newline character used in Zen Coding
 	"""
-	global newline
-	newline = char
+	get_context().newline = char
 
 def string_to_hash(text):
 	"""
@@ -188,23 +423,12 @@ def pad_string(text, pad):
 	@type pad: int, str
 	@return: str
 	"""
-	pad_str = ''
-	result = ''
 	if isinstance(pad, str):
 		pad_str = pad
 	else:
 		pad_str = get_indentation() * pad
-		
-	nl = get_newline()
 	
-	lines = split_by_lines(text)
-	
-	if lines:
-		result += lines[0]
-		for line in lines[1:]:
-			result += nl + pad_str + line
-			
-	return result
+	return (get_newline() + pad_str).join(split_by_lines(text))
 
 def is_snippet(abbr, doc_type = 'html'):
 	"""
@@ -220,7 +444,34 @@ def is_ends_with_tag(text):
 	@type text: str
 	@return: bool
 	"""
-	return re_tag.search(text) != None
+	return ends_with_tag_at(text, len(text))
+
+def ends_with_tag_at(text, end):
+	"""
+	Test if XHTML tag ends right before <code>end</code> index of 
+	<code>text</code>. Only last <code>max_tag_lookback</code> characters
+	are examined and no substrings are created, so the cost doesn't depend
+	on text size
+	@type text: str
+	@type end: int
+	@return: bool
+	"""
+	if end < 1 or text[end - 1] != '>':
+		return False
+	
+	lo = max(0, end - max_tag_lookback)
+	gt = text.rfind('>', lo, end - 1)
+	if gt != -1 and text.find('"', gt, end) == -1 and text.find("'", gt, end) == -1:
+		# '>' outside of quoted attribute value can't be a part of tag
+		lo = gt + 1
+	
+	pos = text.rfind('<', lo, end)
+	while pos != -1:
+		if re_tag.match(text, pos, end):
+			return True
+		pos = text.rfind('<', lo, pos)
+	
+	return False
 
 def get_elements_collection(resource, type):
 	"""
@@ -228,12 +479,29 @@ def get_elements_collection(resource, type):
 	<code>resource</code>. If collections wasn't found, returns empty object
 	@type resource: dict
 	@type type: str
-	@return: dict
+	@return: set
 	"""
 	if 'element_types' in resource and type in resource['element_types']:
 		return resource['element_types'][type]
 	else:
-		return {}
+		return set()
+
+def get_element_flags(resource, name):
+	"""
+	Returns classification flags (<code>stparser.ELEMENT_*</code> bit mask) 
+	of element <code>name</code> from <code>resource</code>
+	@type resource: dict
+	@type name: str
+	@return: int
+	"""
+	table = resource.get('element_flags')
+	if table is None:
+		if 'element_types' not in resource:
+			return 0
+		# settings were created without stparser.get_settings()
+		table = resource['element_flags'] = stparser.get_element_flags_table(resource['element_types'])
+	
+	return table.get(name, 0)
 	
 def replace_variables(text):
 	"""
@@ -241,7 +509,11 @@ def replace_variables(text):
 	@param text: str
 	@return: str
 	"""
-	return re.sub(r'\$\{([\w\-]+)\}', lambda m: get_variable(m.group(1)) or m.group(0), text)
+	if '${' not in text:
+		return text
+	
+	context = get_context()
+	return re_variable.sub(lambda m: context.get_variable(m.group(1)) or m.group(0), text)
 
 def get_abbreviation(res_type, abbr):
 	"""
@@ -270,15 +542,13 @@ def get_variable(name):
 	Returns variable value
 	 @return: str
 	"""
-	if name in zen_settings['variables']:
-		return zen_settings['variables'][name]
-	return None
+	return get_context().get_variable(name)
 
 def set_variable(name, value):
 	"""
 	Set variable value
 	"""
-	zen_settings['variables'][name] = value
+	get_context().set_variable(name, value)
 
 def get_indentation():
 	"""
@@ -287,16 +557,19 @@ def get_indentation():
 	"""
 	return get_variable('indentation');
 
-def create_resource_chain(syntax, name):
+def create_resource_chain(syntax, name, settings=None):
 	"""
 	Creates resource inheritance chain for lookups
 	@param syntax: Syntax name
 	@type syntax: str
 	@param name: Resource name
 	@type name: str
+	@param settings: Settings to look in, current context's if omitted
+	@type settings: dict
 	@return: list
 	"""
 	result = []
+	zen_settings = settings if settings is not None else get_context().settings
 	
 	if syntax in zen_settings:
 		resource = zen_settings[syntax]
@@ -305,11 +578,39 @@ def create_resource_chain(syntax, name):
 		if 'extends' in resource:
 			# find resource in ancestors
 			for type in resource['extends']:
-				if  has_deep_key(zen_settings, [type, name]):
-					result.append(zen_settings[type][name])
+				ancestor = zen_settings.get(type)
+				if ancestor and name in ancestor:
+					result.append(ancestor[name])
 				
 	return result
 
+def _resolve_resource(settings, syntax, name):
+	"""
+	Flattens resource inheritance chain (see 
+	<code>ExpansionContext.get_resource_index()</code>)
+	@return: dict, str or None
+	"""
+	chain = create_resource_chain(syntax, name, settings)
+	if not chain:
+		return None
+	
+	if not isinstance(chain[0], dict):
+		return chain[0]
+	
+	# the first syntax in chain wins, so merge from the end
+	flat = {}
+	for item in reversed(chain):
+		if isinstance(item, dict):
+			flat.update(item)
+	
+	if name == 'abbreviations':
+		raw = dict(flat)
+		for key, entry in raw.items():
+			if entry is not None and entry.type == stparser.TYPE_REFERENCE:
+				flat[key] = raw.get(entry.value)
+	
+	return flat
+
 def get_resource(syntax, name):
 	"""
 	Get resource collection from settings file for specified syntax. 
@@ -325,7 +626,8 @@ def get_resource(syntax, name):
 
 def get_settings_resource(syntax, abbr, name):
 	"""
-	Returns resurce value from data set with respect of inheritance
+	Returns resurce value from data set with respect of inheritance.
+	Abbreviation references are already resolved
 	@param syntax: Resource syntax (html, css, ...)
 	@type syntax: str
 	@param abbr: Abbreviation name
@@ -334,11 +636,13 @@ def get_settings_resource(syntax, abbr, name):
 	@type name: str
 	@return dict, None
 	"""
-	for item in create_resource_chain(syntax, name):
-		if abbr in item:
-			return item[abbr]
-		
-	return None
+	index = get_context().get_resource_index(syntax, name)
+	return index.get(abbr) if index else None
+
+re_word = re.compile(r'[\w\-:\$]+')
+re_space = re.compile(r'\s*')
+re_quoted_value = re.compile(r'(["\'])((?:(?!\1)[^\\]|\\.)*)\1')
+re_unquoted_value = re.compile(r'[^\n]\S*')
 
 def get_word(ix, text):
 	"""
@@ -346,62 +650,63 @@ def get_word(ix, text):
 	@param ix: int
 	@param text: str
 	"""
-	m = re.match(r'^[\w\-:\$]+', text[ix:])
+	m = re_word.match(text, ix)
 	return m.group(0) if m else ''
 	
-def extract_attributes(attr_set):
+def extract_attributes(attr_set, start=0, end=None):
 	"""
 	Extract attributes and their values from attribute set 
- 	@param attr_set: str
+	@param attr_set: str
+	@param start: Index of attribute set start in <code>attr_set</code>
+	@type start: int
+	@param end: Index of attribute set end in <code>attr_set</code>
+	@type end: int
+	@return: list of (name, value) tuples
 	"""
-	attr_set = attr_set.strip()
-	loop_count = 100 # endless loop protection
-	re_string = r'^(["\'])((?:(?!\1)[^\\]|\\.)*)\1'
+	if end is None:
+		end = len(attr_set)
+	
 	result = []
-		
-	while attr_set and loop_count:
-		loop_count -= 1
-		attr_name = get_word(0, attr_set)
-		attr = None
-		if attr_name:
-			attr = {'name': attr_name, 'value': ''}
-			
-			# let's see if attribute has value
-			ch = attr_set[len(attr_name)] if len(attr_set) > len(attr_name) else ''
-			if ch == '=':
-				ch2 = attr_set[len(attr_name) + 1]
-				if ch2 in '"\'':
-					# we have a quoted string
-					m = re.match(re_string, attr_set[len(attr_name) + 1:])
-					if m:
-						attr['value'] = m.group(2)
-						attr_set = attr_set[len(attr_name) + len(m.group(0)) + 1:].strip()
-					else:
-						# something wrong, break loop
-						attr_set = ''
-				else:
-					# unquoted string
-					m = re.match(r'^(.+?)(\s|$)', attr_set[len(attr_name) + 1:])
-					if m:
-						attr['value'] = m.group(1)
-						attr_set = attr_set[len(attr_name) + len(m.group(1)) + 1:].strip()
-					else:
-						# something wrong, break loop
-						attr_set = ''
-				
-			else:
-				attr_set = attr_set[len(attr_name):].strip()
-		else:
+	pos = re_space.match(attr_set, start, end).end()
+	while pos < end:
+		m = re_word.match(attr_set, pos, end)
+		if not m:
 			# something wrong, can't extract attribute name
 			break
 		
-		if attr: result.append(attr)
+		attr_name = m.group(0)
+		value = ''
+		pos = m.end()
+		
+		# let's see if attribute has value
+		if pos < end and attr_set[pos] == '=':
+			pos += 1
+			if pos < end and attr_set[pos] in '"\'':
+				# we have a quoted string
+				m = re_quoted_value.match(attr_set, pos, end)
+				if m:
+					value = m.group(2)
+			else:
+				m = re_unquoted_value.match(attr_set, pos, end)
+				if m:
+					value = m.group(0)
+			
+			if not m:
+				# something wrong, stop at this attribute
+				result.append((attr_name, value))
+				break
+			
+			pos = m.end()
+		
+		result.append((attr_name, value))
+		pos = re_space.match(attr_set, pos, end).end()
 		
 	return result
 
 def parse_attributes(text):
 	"""
 	Parses tag attributes extracted from abbreviation
+	@return: list of (name, value) tuples
 	"""
 	
 #	Example of incoming data:
@@ -412,8 +717,8 @@ def parse_attributes(text):
 #	#item[attr=Hello other="World"].class
 
 	result = []
-	class_name = None
-	char_map = {'#': 'id', '.': 'class'}
+	class_ix = -1
+	class_name = ''
 	
 	# walk char-by-char
 	i = 0
@@ -423,22 +728,23 @@ def parse_attributes(text):
 		ch = text[i]
 		
 		if ch == '#': # id
-			val = get_word(i, text[1:])
-			result.append({'name': char_map[ch], 'value': val})
+			val = get_word(i + 1, text)
+			result.append(('id', val))
 			i += len(val) + 1
 			
 		elif ch == '.': #class
-			val = get_word(i, text[1:])
-			if not class_name:
-				# remember object pointer for value modification
-				class_name = {'name': char_map[ch], 'value': ''}
-				result.append(class_name)
+			val = get_word(i + 1, text)
+			if class_ix == -1:
+				# remember position for value modification
+				class_ix = len(result)
+				result.append(None)
 			
-			if class_name['value']:
-				class_name['value'] += ' ' + val
+			if class_name:
+				class_name += ' ' + val
 			else:
-				class_name['value'] = val
+				class_name = val
 			
+			result[class_ix] = ('class', class_name)
 			i += len(val) + 1
 				
 		elif ch == '[': # begin attribute set
@@ -448,7 +754,7 @@ def parse_attributes(text):
 				# invalid attribute set, stop searching
 				i = len(text)
 			else:
-				result.extend(extract_attributes(text[i + 1:end_ix]))
+				result.extend(extract_attributes(text, i + 1, end_ix))
 				i = end_ix
 		else:
 			i += 1
@@ -456,80 +762,261 @@ def parse_attributes(text):
 		
 	return result
 
-class AbbrGroup(object):
+class AbbreviationError(ValueError):
 	"""
-	Abreviation's group element
+	Syntax error in abbreviation
 	"""
-	def __init__(self, parent=None):
+	def __init__(self, message, offset):
 		"""
-		@param parent: Parent group item element
-		@type parent: AbbrGroup
+		@param message: Error description
+		@type message: str
+		@param offset: Character index in abbreviation where error occured
+		@type offset: int
 		"""
-		self.expr = ''
-		self.parent = parent
-		self.children = []
+		super(AbbreviationError, self).__init__('%s at character %d' % (message, offset))
+		self.offset = offset
+
+re_element = re.compile(r'([a-z@\!\#\.][\w:\-]*)((?:(?:[#\.][\w\-\$]+)|(?:\[[^\]]+\]))+)?(\*(\d*))?', re.IGNORECASE)
+"Element token: tag name, attributes and multiplier"
+
+class AbbreviationParser(object):
+	"""
+	Single-pass abbreviation parser. Abbreviation is split into tokens 
+	(elements, operators and group braces) by <code>tokenize()</code>, and 
+	tokens are immediately added into <code>Tag</code> tree. Groups are
+	handled with explicit stack, so there's no limit on abbreviation length
+	or nesting depth
+	
+	@example
+	root = AbbreviationParser('ul#nav>li*5>a', 'html').parse()
+	"""
+	def __init__(self, abbr, doc_type='html'):
+		"""
+		@param abbr: Abbreviation to parse (without filters)
+		@type abbr: str
+		@param doc_type: Document type (xsl, html), a key of dictionary where to
+		search abbreviation settings
+		@type doc_type: str
+		"""
+		self.abbr = abbr
+		self.doc_type = doc_type
 		
-	def add_child(self):
-		child = AbbrGroup(self)
-		self.children.append(child)
-		return child
+	def tokenize(self, text, offset=0):
+		"""
+		Splits text into tokens. Each token is a tuple of token type
+		('>', '+', '(', ')' or 'element'), token data (element regexp match
+		and expando flag for 'element' tokens) and token offset in 
+		abbreviation. Expandos (like <code>ul+</code>) are replaced with 
+		tokens of expanded abbreviation
+		@param text: Text to tokenize
+		@type text: str
+		@param offset: Offset of text in original abbreviation (used for
+		error reporting)
+		@type offset: int
+		"""
+		i = 0
+		il = len(text)
+		while i < il:
+			ch = text[i]
+			if ch in '+>()':
+				yield (ch, None, offset + i)
+				i += 1
+				continue
+			
+			m = re_element.match(text, i)
+			if not m:
+				raise AbbreviationError('Unexpected "%s"' % ch, offset + i)
+			
+			i = m.end()
+			has_expando = False
+			if char_at(text, i) == '+':
+				# "+" at the end of group is an expando, not operator
+				next_char = char_at(text, i + 1)
+				if not next_char or next_char == ')' or (next_char in '+>' and char_at(text, i + 2) == '('):
+					has_expando = True
+					i += 1
+			
+			if has_expando and m.end(1) == m.end():
+				expando = get_abbreviation(self.doc_type, m.group(1) + '+')
+				if expando and expando.type == stparser.TYPE_EXPANDO:
+					for token in self.tokenize(expando.value):
+						yield (token[0], token[1], offset + m.start())
+					continue
+				
+			yield ('element', (m, has_expando), offset + m.start())
 	
-	def clean_up(self):
-		for item in self.children:
-			expr = item.expr
-			if not expr:
-				self.children.remove(item)
+	def create_tag(self, m, has_expando):
+		"""
+		Creates tag or snippet from element token
+		@param m: Element token match
+		@param has_expando: Element has unknown expando operator
+		@type has_expando: bool
+		@return: Tag
+		"""
+		tag_name, attrs, multiplier = m.group(1, 2, 4)
+		multiplier = multiplier and int(multiplier) or 1
+		
+		tag_ch = tag_name[0]
+		if tag_ch == '#' or tag_ch == '.':
+			attrs = tag_name + (attrs or '')
+			tag_name = default_tag
+		
+		if has_expando:
+			tag_name += '+'
+		
+		if is_snippet(tag_name, self.doc_type):
+			current = Snippet(tag_name, multiplier, self.doc_type)
+		else:
+			current = Tag(tag_name, multiplier, self.doc_type)
+		
+		if attrs:
+			current.add_attributes(parse_attributes(attrs))
+		
+		return current
+	
+	def parse(self):
+		"""
+		Parses abbreviation into a tag tree
+		@return: Tag
+		@raise AbbreviationError: Abbreviation contains syntax error
+		"""
+		root = Tag('', 1, self.doc_type)
+		root.last = None
+		
+		# element where next group items will be added
+		context = root
+		stack = []
+		
+		parent = root
+		last = None
+		operator = None
+		after_group = False
+		
+		for token_type, data, offset in self.tokenize(self.abbr):
+			if token_type == '>' or token_type == '+':
+				if operator:
+					raise AbbreviationError('Unexpected "%s"' % token_type, offset)
+				if not after_group:
+					# operator right after group is ignored: next element
+					# is always added as a group sibling
+					operator = token_type
+				after_group = False
+				continue
+			
+			after_group = False
+			if token_type == '(':
+				if operator == '>' and last:
+					# group content will be added into last element
+					context = last
+				stack.append(context)
+				parent = context
+				last = operator = None
+				
+			elif token_type == ')':
+				if operator or not stack:
+					raise AbbreviationError('Unexpected ")"', offset)
+				context = parent = stack.pop()
+				last = None
+				after_group = True
+				
 			else:
-				# remove operators at the and of expression
-				item.clean_up()
+				if operator == '>' and last:
+					parent = last
+				
+				m, has_expando = data
+				last = self.create_tag(m, has_expando)
+				parent.add_child(last)
+				root.last = last
+				if m.group(3) and not m.group(4):
+					# multiply by lines
+					root.multiply_elem = last
+				
+				operator = None
+		
+		if operator:
+			raise AbbreviationError('Unexpected end of abbreviation', len(self.abbr))
+		
+		return root
 
-def split_by_groups(abbr):
+def walk_tree(tree, level=0):
+	"""
+	Walks over all descendants of <code>tree</code> in document order
+	(the same order as recursive depth-first traversal gives) using explicit
+	stack instead of recursion, so very deep trees can be traversed too.
+	Node's children are taken right after node is yielded, thus caller may
+	alter them.
+	@param tree: Tree root
+	@type tree: ZenNode, Tag
+	@param level: Depth level of root's children
+	@type level: int
+	@return: generator of (node, level) tuples
+	"""
+	stack = [(child, level) for child in reversed(tree.children)]
+	while stack:
+		node, node_level = stack.pop()
+		yield node, node_level
+		if node.children:
+			stack.extend([(child, node_level + 1) for child in reversed(node.children)])
+
+def compute_layout(tree):
 	"""
-	Split abbreviation by groups
-	@type abbr: str
-	@return: AbbrGroup
+	Computes layout facts (<code>LAYOUT_*</code> bit mask) used by output
+	formatting for <code>tree</code> and all its descendants in a single
+	pass. Facts are stored in <code>layout</code> property of each node and
+	reflect its current content and children. Lengths of inline runs are
+	stored in <code>inline_run</code> property
+	@type tree: ZenNode
+	@return: ZenNode
 	"""
-	root = AbbrGroup()
-	last_parent = root
-	cur_item = root.add_child()
-	stack = []
-	i = 0
-	il = len(abbr)
+	tree.layout = _get_node_layout(tree)
+	if tree.children:
+		_set_inline_runs(tree.children[0])
 	
-	while i < il:
-		ch = abbr[i]
-		if ch == '(':
-			# found new group
-			operator = i and abbr[i - 1] or ''
-			if operator == '>':
-				stack.append(cur_item)
-				last_parent = cur_item
-			else:
-				stack.append(last_parent)
-			cur_item = None
-		elif ch == ')':
-			last_parent = stack.pop()
-			cur_item = None
-			next_char = char_at(abbr, i + 1)
-			if next_char == '+' or next_char == '>': 
-				# next char is group operator, skip it
-				i += 1
+	for node, level in walk_tree(tree):
+		node.layout = _get_node_layout(node)
+		if node.children:
+			_set_inline_runs(node.children[0])
+	
+	return tree
+
+def _set_inline_runs(node):
+	"""
+	Sweeps over <code>node</code> and its next siblings and sets size of 
+	inline run (how many inline elements are outputted in a row, counting
+	repetitions) to each of them. Non-inline elements get zero
+	@type node: ZenNode
+	"""
+	run = []
+	size = 0
+	while node:
+		if node.is_inline():
+			run.append(node)
+			size += node.repeat
 		else:
-			if ch == '+' or ch == '>':
-				# skip operator if it's followed by parenthesis
-				next_char = char_at(abbr, i + 1)
-				if next_char == '(':
-					i += 1 
-					continue
-			
-			if not cur_item:
-				cur_item = last_parent.add_child()
-			cur_item.expr += ch
-			
-		i += 1
+			node.inline_run = 0
+			for item in run:
+				item.inline_run = size
+			run = []
+			size = 0
+		node = node.next_sibling
+	
+	for item in run:
+		item.inline_run = size
+
+def _get_node_layout(node):
+	layout = 0
+	if node.has_tags_in_content():
+		layout |= LAYOUT_TAGS_IN_CONTENT
+		if node.is_block():
+			layout |= LAYOUT_BLOCK_CHILDREN
+	
+	if not layout & LAYOUT_BLOCK_CHILDREN:
+		for child in node.children:
+			if child.is_block():
+				layout |= LAYOUT_BLOCK_CHILDREN
+				break
 	
-	root.clean_up()
-	return root
+	return layout
 
 def rollout_tree(tree, parent=None):
 	"""
@@ -548,36 +1035,54 @@ def rollout_tree(tree, parent=None):
 	"""
 	if not parent:
 		parent = ZenNode(tree)
-		
-	how_many = 1
-	tag_content = ''
 	
-	for child in tree.children:
-		how_many = child.count
-		
-		if child.repeat_by_lines:
-			# it's a repeating element
-			tag_content = split_by_lines(child.get_content(), True)
-			how_many = max(len(tag_content), 1)
-		else:
-			tag_content = child.get_content()
-		
-		for j in range(how_many):
-			tag = ZenNode(child)
-			parent.add_child(tag)
-			tag.counter = j + 1
+	# (node, content) pairs; content goes to node's deepest child, so it
+	# can be placed only when the whole tree is rolled out
+	filled = []
+	stack = [(tree, parent)]
+	
+	while stack:
+		source, target = stack.pop()
+		for child in source.children:
+			how_many = child.count
 			
-			if child.children:
-				rollout_tree(child, tag)
-				
-			add_point = tag.find_deepest_child() or tag
+			if child.repeat_by_lines:
+				# it's a repeating element
+				tag_content = split_by_lines(child.get_content(), True)
+				how_many = max(len(tag_content), 1)
+			else:
+				tag_content = child.get_content()
 			
-			if tag_content:
-				if isinstance(tag_content, str):
-					add_point.content = tag_content
-				else:
-					add_point.content = tag_content[j] or ''
-					
+			if how_many > lazy_repeat_threshold and isinstance(tag_content, str) \
+					and not has_tabstops(child):
+				# roll out first element, all others are represented 
+				# by a single lazy node (tabstops have to be renumbered
+				# in each copy, so elements with tabstops are rolled out)
+				repeats = ((1, 1), (2, how_many - 1))
+			else:
+				repeats = ((j + 1, 1) for j in range(how_many))
+			
+			for counter, repeat in repeats:
+				tag = ZenNode(child)
+				target.add_child(tag)
+				tag.counter = counter
+				tag.repeat = repeat
+				
+				if child.children:
+					stack.append((child, tag))
+				
+				if tag_content:
+					if isinstance(tag_content, str):
+						filled.append((tag, tag_content))
+					else:
+						filled.append((tag, tag_content[counter - 1] or ''))
+	
+	# descendants were added after their ancestors: walk backwards so
+	# outer element's content wins, as it does for nested elements
+	for tag, content in reversed(filled):
+		add_point = tag.find_deepest_child() or tag
+		add_point.content = content
+	
 	return parent
 
 def run_filters(tree, profile, filter_list):
@@ -585,135 +1090,218 @@ def run_filters(tree, profile, filter_list):
 	Runs filters on tree
 	@type tree: ZenNode
 	@param profile: str, object
-	@param filter_list: str, list
+	@param filter_list: Filter names or compiled chain 
+	(see <code>get_filter_chain()</code>)
+	@type filter_list: str, list, tuple
 	@return: ZenNode
 	"""
-	from . import filters
-	
+	profiles = get_context().profiles
 	if isinstance(profile, str) and profile in profiles:
 		profile = profiles[profile];
 	
 	if not profile:
 		profile = profiles['plain']
+	
+	if not isinstance(filter_list, tuple):
+		filter_list = compile_filter_list(filter_list)
 		
-	if isinstance(filter_list, str):
-		filter_list = re.split(r'[\|,]', filter_list)
-		
-	for name in filter_list:
-		name = name.strip()
-		if name and name in filters.filter_map:
-			tree = filters.filter_map[name](tree, profile)
+	for stage in filter_list:
+		tree = stage(tree, profile)
 			
 	return tree
 
-def abbr_to_primary_tree(abbr, doc_type='html'):
-	"""
-	Transforms abbreviation into a primary internal tree. This tree should'n 
-	be used ouside of this scope
-	@param abbr: Abbreviation to transform
-	@type abbr: str
-	@param doc_type: Document type (xsl, html), a key of dictionary where to
-	search abbreviation settings
-	@type doc_type: str
-	@return: Tag
+def compile_filter_list(filter_list):
+	"""
+	Returns compiled chain (tuple of stages) of filters in 
+	<code>filter_list</code>. Chains are cached until context settings are
+	changed (after registering new filter, call 
+	<code>invalidate_caches()</code>)
+	@type filter_list: str, list
+	@return: tuple
+	"""
+	if not isinstance(filter_list, str):
+		filter_list = '|'.join(filter_list)
+	
+	key = (filter_list, get_context().generation)
+	chain = filter_cache.get(key)
+	if chain is None:
+		from . import filters
+		chain = tuple(compile_filters(filter_list, filters.filter_modules))
+		filter_cache.set(key, chain)
+	
+	return chain
+
+def get_filter_chain(syntax, additional_filters=None):
 	"""
-	root = Tag('', 1, doc_type)
-	token = re.compile(r'([\+>])?([a-z@\!\#\.][\w:\-]*)((?:(?:[#\.][\w\-\$]+)|(?:\[[^\]]+\]))+)?(\*(\d*))?(\+$)?', re.IGNORECASE)
-	
-	if not abbr:
-		return None
-	
-	def expando_replace(m):
-		ex = m.group(0)
-		a = get_abbreviation(doc_type, ex)
-		return a and a.value or ex
-		
-	def token_expander(operator, tag_name, attrs, has_multiplier, multiplier, has_expando):
-		multiply_by_lines = (has_multiplier and not multiplier)
-		multiplier = multiplier and int(multiplier) or 1
-		
-		tag_ch = tag_name[0]
-		if tag_ch == '#' or tag_ch == '.':
-			if attrs: attrs = tag_name + attrs
-			else: attrs = tag_name
-			tag_name = default_tag
-		
-		if has_expando:
-			tag_name += '+'
-		
-		current = is_snippet(tag_name, doc_type) and Snippet(tag_name, multiplier, doc_type) or Tag(tag_name, multiplier, doc_type)
-		
-		if attrs:
-			attrs = parse_attributes(attrs)
-			for attr in attrs:
-				current.add_attribute(attr['name'], attr['value'])
-			
-		# dive into tree
-		if operator == '>' and token_expander.last:
-			token_expander.parent = token_expander.last;
-			
-		token_expander.parent.add_child(current)
-		token_expander.last = current
-		
-		if multiply_by_lines:
-			root.multiply_elem = current
-		
-		return ''
+	Returns compiled chain of filters that should be applied to
+	<code>syntax</code> tree
+	@param syntax: Syntax name ('html', 'css', etc.)
+	@type syntax: str
+	@param additional_filters: List or pipe-separated string of additional filters to apply
+	@type additional_filters: str, list
+	@return: tuple
+	"""
+	if additional_filters and not isinstance(additional_filters, str):
+		additional_filters = '|'.join(additional_filters)
+	
+	key = (syntax, additional_filters or '', get_context().generation)
+	chain = filter_cache.get(key)
+	if chain is None:
+		_filters = get_resource(syntax, 'filters') or basic_filters
+		if additional_filters:
+			_filters += '|' + additional_filters
 		
-	# replace expandos
-	abbr = re.sub(r'([a-z][a-z0-9]*)\+$', expando_replace, abbr)
-	
-	token_expander.parent = root
-	token_expander.last = None
+		chain = compile_filter_list(_filters)
+		filter_cache.set(key, chain)
 	
+	return chain
+
+def compile_filters(filter_list, modules):
+	"""
+	Creates list of stages for filter chain. Each stage is a callable that
+	takes tree and profile and returns filtered tree.
+	
+	Filter module may define <code>enter(item, profile, level)</code>
+	and/or <code>leave(item, profile, level)</code> hooks, called for each
+	node in pre-order and post-order respectively, and optional
+	<code>begin(tree, profile)</code> hook, called before traversal (it may
+	return <code>False</code> to skip filter). Consecutive filters with 
+	hooks are fused into a single tree traversal, so hook may rely only on 
+	current node and its ancestors. Filters required by module (listed in
+	its <code>requires</code> property) are inserted right before it.
+	Modules with <code>process(tree, profile)</code> function only are
+	applied as separate stage.
+	@param filter_list: str, list
+	@param modules: Filter name -> module map
+	@type modules: dict
+	@return: list
+	"""
+	if isinstance(filter_list, str):
+		filter_list = re.split(r'[\|,]', filter_list)
 	
-#	abbr = re.sub(token, lambda m: token_expander(m.group(1), m.group(2), m.group(3), m.group(4), m.group(5), m.group(6), m.group(7)), abbr)
-	# Issue from Einar Egilsson
-	abbr = token.sub(lambda m: token_expander(m.group(1), m.group(2), m.group(3), m.group(4), m.group(5), m.group(6)), abbr)
-	
-	root.last = token_expander.last
+	stages = []
+	fused = None
+	for module in _expand_filter_list(filter_list, modules):
+		if hasattr(module, 'enter') or hasattr(module, 'leave'):
+			if fused is None:
+				fused = FilterPass()
+				stages.append(fused)
+			fused.add(module)
+		else:
+			fused = None
+			stages.append(module.process)
 	
-	# empty 'abbr' variable means that abbreviation was expanded successfully, 
-	# non-empty variable means there was a syntax error
-	return not abbr and root or None;
+	return stages
 
-def expand_group(group, doc_type, parent):
+def _expand_filter_list(filter_list, modules):
 	"""
-	Expand single group item 
-	@param group: AbbrGroup
-	@param doc_type: str
-	@param parent: Tag
+	Returns list of filter modules for names in <code>filter_list</code>, 
+	including filters they require. Unknown filters are skipped with a
+	warning, reported once for each name
+	@return: list
 	"""
-	tree = abbr_to_primary_tree(group.expr, doc_type)
-	last_item = None
+	result = []
+	for name in filter_list:
+		name = name.strip()
+		if not name:
+			continue
 		
-	if tree:
-		for item in tree.children:
-			last_item = item
-			parent.add_child(last_item)
-	else:
-		raise Exception('InvalidGroup')
+		if name in modules:
+			module = modules[name]
+			requires = getattr(module, 'requires', None)
+			if requires:
+				result.extend(_expand_filter_list(requires.split(','), modules))
+			result.append(module)
+		elif name not in _reported_filters:
+			_reported_filters.add(name)
+			warnings.warn('Unknown Zen Coding filter: %s' % name)
 	
+	return result
+
+class FilterPass(object):
+	"""
+	Applies hooks of several filters during a single tree traversal
+	"""
+	def __init__(self, modules=()):
+		self.modules = []
+		for module in modules:
+			self.add(module)
 	
-	# set repeating element to the topmost node
-	root = parent
-	while root.parent:
-		root = root.parent
+	def add(self, module):
+		"""
+		Adds filter module to pass
+		"""
+		self.modules.append(module)
 	
-	root.last = tree.last
-	if tree.multiply_elem:
-		root.multiply_elem = tree.multiply_elem
+	def __call__(self, tree, profile):
+		"""
+		Applies filters to tree
+		@type tree: ZenNode
+		@type profile: dict
+		@return: ZenNode
+		"""
+		enter_hooks = []
+		leave_hooks = []
+		for module in self.modules:
+			begin = getattr(module, 'begin', None)
+			if begin and begin(tree, profile) is False:
+				continue
+			
+			if hasattr(module, 'enter'):
+				enter_hooks.append(module.enter)
+			if hasattr(module, 'leave'):
+				leave_hooks.append(module.leave)
+		
+		run_hooks(tree, profile, enter_hooks, leave_hooks)
+		return tree
+
+def run_hooks(tree, profile, enter_hooks, leave_hooks=(), level=0):
+	"""
+	Traverses all descendants of <code>tree</code> (see 
+	<code>walk_tree()</code>) calling each of <code>enter_hooks</code>
+	with node, profile and depth level before node's children are visited
+	and each of <code>leave_hooks</code> after
+	@type tree: ZenNode
+	@type profile: dict
+	@type enter_hooks: list
+	@type leave_hooks: list
+	@type level: int
+	"""
+	if not leave_hooks:
+		for node, node_level in walk_tree(tree, level):
+			for hook in enter_hooks:
+				hook(node, profile, node_level)
+		return
+	
+	stack = [(child, level, False) for child in reversed(tree.children)]
+	while stack:
+		node, node_level, leaving = stack.pop()
+		if leaving:
+			for hook in leave_hooks:
+				hook(node, profile, node_level)
+			continue
+		
+		for hook in enter_hooks:
+			hook(node, profile, node_level)
 		
-	# process child groups
-	if group.children:
-		add_point = last_item.find_deepest_child() or last_item
-		for child in group.children:
-			expand_group(child, doc_type, add_point)
+		stack.append((node, node_level, True))
+		if node.children:
+			stack.extend([(child, node_level + 1, False) for child in reversed(node.children)])
+
+_symbol_patterns = {}
 
 def replace_unescaped_symbol(text, symbol, replace):
 	"""
 	Replaces unescaped symbols in <code>text</code>. For example, the '$' symbol
 	will be replaced in 'item$count', but not in 'item\$count'.
+	
+	If <code>replace</code> is a function, it's called for every match with
+	original text, symbol, match position in original text and match number
+	and should return (matched_string, replacement) tuple or <code>False</code>
+	to leave this match as is.
+	
+	Result is collected as a list of pieces in a single pass, so the cost
+	doesn't depend on the number of matches.
 	@param text: Original string
 	@type text: str
 	@param symbol: Symbol to replace
@@ -722,40 +1310,57 @@ def replace_unescaped_symbol(text, symbol, replace):
 	@type replace: str, function 
 	@return: str
 	"""
-	i = 0
-	il = len(text)
+	if symbol not in text:
+		return text
+	
+	pattern = _symbol_patterns.get(symbol)
+	if pattern is None:
+		pattern = _symbol_patterns[symbol] = re.compile(r'\\|' + re.escape(symbol))
+	
+	is_func = callable(replace)
 	sl = len(symbol)
 	match_count = 0
+	pieces = []
+	last = 0
+	i = 0
+	
+	while True:
+		m = pattern.search(text, i)
+		if not m:
+			break
 		
-	while i < il:
+		i = m.start()
 		if text[i] == '\\':
 			# escaped symbol, skip next character
 			i += sl + 1
-		elif text[i:i + sl] == symbol:
-			# have match
-			cur_sl = sl
-			match_count += 1
-			new_value = replace
-			if isinstance(new_value, collections.Callable):
-				replace_data = replace(text, symbol, i, match_count)
-				if replace_data:
-					cur_sl = len(replace_data[0])
-					new_value = replace_data[1]
-				else:
-					new_value = False
-			
-			if new_value is False: # skip replacement
-				i += 1
-				continue
-			
-			text = text[0:i] + new_value + text[i + cur_sl:]
-			# adjust indexes
-			il = len(text)
-			i += len(new_value)
-		else:
+			continue
+		
+		# have match
+		cur_sl = sl
+		match_count += 1
+		new_value = replace
+		if is_func:
+			replace_data = replace(text, symbol, i, match_count)
+			if replace_data:
+				cur_sl = len(replace_data[0])
+				new_value = replace_data[1]
+			else:
+				new_value = False
+		
+		if new_value is False: # skip replacement
 			i += 1
+			continue
+		
+		pieces.append(text[last:i])
+		pieces.append(new_value)
+		i += cur_sl
+		last = i
+	
+	if not pieces:
+		return text
 	
-	return text
+	pieces.append(text[last:])
+	return ''.join(pieces)
 	
 def run_action(name, *args, **kwargs):
 	"""
@@ -778,19 +1383,177 @@ def run_action(name, *args, **kwargs):
 	except:
 		return False
 
-def expand_abbreviation(abbr, syntax='html', profile_name='plain'):
+def expand_abbreviation(abbr, syntax='html', profile_name='plain', base_indent=''):
 	"""
 	Expands abbreviation into a XHTML tag string
 	@type abbr: str
+	@param base_indent: Indentation of every line except the first one, 
+	usually the padding of editor's line where abbreviation is expanded
+	@type base_indent: str
 	@return: str
 	"""
-	tree_root = parse_into_tree(abbr, syntax);
-	if tree_root:
-		tree = rollout_tree(tree_root)
-		apply_filters(tree, syntax, profile_name, tree_root.filters)
-		return replace_variables(tree.to_string())
+	if not isinstance(profile_name, str) or callable(get_context().caret_placeholder):
+		# profile objects and generated caret placeholders are not cached
+		return ''.join(iter_expand_abbreviation(abbr, syntax, profile_name, base_indent))
+	
+	compiled = _get_template(abbr, syntax, profile_name)
+	if compiled is None:
+		return ''
+	if isinstance(compiled, CompiledAbbreviation):
+		return compiled.render(base_indent)
+	
+	# output is too large to be cached
+	return ''.join(_fill_chunks(compiled[0], base_indent))
+
+def iter_expand_abbreviation(abbr, syntax='html', profile_name='plain', base_indent=''):
+	"""
+	Streaming variant of <code>expand_abbreviation()</code>: expanded
+	abbreviation is generated chunk by chunk, without building the whole
+	output string. Useful for very large expansions written to file or
+	editor buffer
+	@type abbr: str
+	@type base_indent: str
+	@return: generator of str
+	"""
+	tree = _expand_tree(abbr, syntax, profile_name)
+	if tree is None:
+		return iter(())
+	
+	return _iter_output(tree, base_indent)
+
+def _expand_tree(abbr, syntax, profile_name):
+	"""
+	Parses abbreviation (using parse cache), rolls it out and applies
+	filters
+	@return: ZenNode, None if abbreviation can't be parsed
+	"""
+	tree_root = parse_into_tree(abbr, syntax)
+	if not tree_root:
+		return None
+	
+	tree = rollout_tree(tree_root)
+	apply_filters(tree, syntax, profile_name, tree_root.filters)
+	return tree
+
+class CompiledAbbreviation(object):
+	"""
+	Expanded abbreviation, prepared for fast output. Expansion result is
+	stored as a list of literal strings with holes for variables; these 
+	holes are filled with current values and output is padded with base 
+	indentation on <code>render()</code> call. The last result is kept 
+	until any of used variables is changed
+	"""
+	def __init__(self, text, tabstops=None):
+		"""
+		@param text: Expanded abbreviation with unreplaced variables
+		@type text: str
+		@param tabstops: Tabstop index -> placeholder map of expansion
+		@type tabstops: dict
+		"""
+		self.tabstops = tabstops or {}
+		self.parts = []
+		self.holes = []
+		self.size = len(text)
+		
+		variables = set()
+		last = 0
+		for m in re_variable.finditer(text):
+			if m.start() > last:
+				self.parts.append(text[last:m.start()])
+			self.holes.append((len(self.parts), m.group(1)))
+			self.parts.append(m.group(0))
+			last = m.end()
+			variables.add(m.group(1))
+		
+		if last < len(text):
+			self.parts.append(text[last:])
+		
+		self.variables = tuple(sorted(variables))
+		"Names of variables used in output"
+		
+		self._last_render = None
+	
+	def render(self, base_indent=''):
+		"""
+		Returns expanded abbreviation with current variable values
+		@param base_indent: Indentation added after each newline
+		@type base_indent: str
+		@return: str
+		"""
+		context = get_context()
+		key = (context.generation, base_indent,
+			[context.get_variable_version(name) for name in self.variables])
+		last_render = self._last_render
+		if last_render is not None and last_render[0] == key:
+			return last_render[1]
+		
+		parts = list(self.parts)
+		for i, var_name in self.holes:
+			parts[i] = get_variable(var_name) or parts[i]
+		
+		text = ''.join(parts)
+		if base_indent:
+			text = pad_string(text, base_indent)
+		
+		self._last_render = (key, text)
+		return text
+
+def compile_abbreviation(abbr, syntax='html', profile_name='plain'):
+	"""
+	Compiles abbreviation into a <code>CompiledAbbreviation</code> object
+	which can be rendered many times. Compiled abbreviations are cached, 
+	unless their output is larger than <code>max_template_size</code>
+	@param abbr: Abbreviation to compile
+	@type abbr: str
+	@param syntax: Syntax name ('html', 'css', etc.)
+	@type syntax: str
+	@param profile_name: Output profile's name
+	@type profile_name: str
+	@return: CompiledAbbreviation, None if abbreviation can't be parsed
+	"""
+	compiled = _get_template(abbr, syntax, profile_name)
+	if compiled is None or isinstance(compiled, CompiledAbbreviation):
+		return compiled
 	
-	return ''
+	chunks, tabstops = compiled
+	return CompiledAbbreviation(''.join(chunks), tabstops)
+
+def _get_template(abbr, syntax, profile_name):
+	"""
+	Returns cached compiled abbreviation. Output depends on newline, 
+	indentation and caret placeholder, so their values are a part of 
+	cache key. Cached entry is valid only for the same profile object, 
+	so profiles redefined with <code>setup_profile()</code> are compiled 
+	again
+	@return: CompiledAbbreviation, None if abbreviation can't be parsed or,
+	if output exceeds <code>max_template_size</code>, (chunks, tabstops) 
+	tuple, where chunks is an iterator of output with unreplaced variables
+	"""
+	context = get_context()
+	profile = get_profile(profile_name)
+	key = (abbr, syntax, profile_name, context.generation, context.newline,
+			context.caret_placeholder, get_indentation())
+	entry = template_cache.get(key)
+	if entry is not None and entry[0] is profile:
+		return entry[1]
+	
+	compiled = None
+	tree = _expand_tree(abbr, syntax, profile_name)
+	if tree is not None:
+		tabstops = tree.tabstops and tree.tabstops.tabstops
+		chunks = tree.iter_chunks()
+		head = []
+		size = 0
+		for chunk in chunks:
+			head.append(chunk)
+			size += len(chunk)
+			if size > max_template_size:
+				return (itertools.chain(head, chunks), tabstops)
+		
+		compiled = CompiledAbbreviation(''.join(head), tabstops)
+	
+	template_cache.set(key, (profile, compiled))
+	return compiled
 
 def extract_abbreviation(text):
 	"""
@@ -819,7 +1582,7 @@ def extract_abbreviation(text):
 			if brace_count: 
 				# respect all characters inside attribute sets
 				continue
-			if not is_allowed_char(ch) or (ch == '>' and is_ends_with_tag(text[0:cur_offset + 1])):
+			if not is_allowed_char(ch) or (ch == '>' and ends_with_tag_at(text, cur_offset + 1)):
 				# found stop symbol
 				start_index = cur_offset + 1
 				break
@@ -828,7 +1591,10 @@ def extract_abbreviation(text):
 
 def parse_into_tree(abbr, doc_type='html'):
 	"""
-	Parses abbreviation into a node set
+	Parses abbreviation into a node set. Parsed trees are cached, so
+	the same abbreviation is parsed only once per context generation;
+	each call returns a fresh copy of cached tree which can be safely
+	modified
 	@param abbr: Abbreviation to transform
 	@type abbr: str
 	@param doc_type: Document type (xsl, html), a key of dictionary where to
@@ -836,6 +1602,21 @@ def parse_into_tree(abbr, doc_type='html'):
 	@type doc_type: str
 	@return: Tag
 	"""
+	key = (abbr, doc_type, get_context().generation)
+	tree_root = parse_cache.get(key, _missing)
+	if tree_root is _missing:
+		tree_root = _parse_into_tree(abbr, doc_type)
+		parse_cache.set(key, tree_root)
+	
+	return tree_root and tree_root.clone()
+
+def _parse_into_tree(abbr, doc_type='html'):
+	"""
+	Parses abbreviation into a node set, bypassing parse cache
+	@type abbr: str
+	@type doc_type: str
+	@return: Tag
+	"""
 	# remove filters from abbreviation
 	filter_list = []
 	
@@ -846,16 +1627,10 @@ def parse_into_tree(abbr, doc_type='html'):
 	re_filter = re.compile(r'\|([\w\|\-]+)$')
 	abbr = re_filter.sub(filter_replace, abbr)
 	
-	# split abbreviation by groups
-	group_root = split_by_groups(abbr)
-	tree_root = Tag('', 1, doc_type)
-	
-	# then recursively expand each group item
 	try:
-		for item in group_root.children:
-			expand_group(item, doc_type, tree_root)
-	except:
-		# there's invalid group, stop parsing
+		tree_root = AbbreviationParser(abbr, doc_type).parse()
+	except Exception:
+		# syntax error or invalid element, stop parsing
 		return None
 	
 	tree_root.filters = ''.join(filter_list)
@@ -878,7 +1653,7 @@ def is_inside_tag(html, cursor_pos):
 
 	return False
 
-def wrap_with_abbreviation(abbr, text, doc_type='html', profile='plain'):
+def wrap_with_abbreviation(abbr, text, doc_type='html', profile='plain', base_indent=''):
 	"""
 	Wraps passed text with abbreviation. Text will be placed inside last
 	expanded element
@@ -893,8 +1668,23 @@ def wrap_with_abbreviation(abbr, text, doc_type='html', profile='plain'):
 	
 	@param profile: Output profile's name.
 	@type profile: str
+	
+	@param base_indent: Indentation of every line except the first one
+	@type base_indent: str
 	@return {String}
 	"""
+	chunks = iter_wrap_with_abbreviation(abbr, text, doc_type, profile, base_indent)
+	if chunks is not None:
+		return ''.join(chunks)
+	
+	return None
+
+def iter_wrap_with_abbreviation(abbr, text, doc_type='html', profile='plain', base_indent=''):
+	"""
+	Streaming variant of <code>wrap_with_abbreviation()</code>: returns
+	generator of output chunks with variables already replaced
+	@return: generator of str, None if abbreviation can't be parsed
+	"""
 	tree_root = parse_into_tree(abbr, doc_type)
 	if tree_root:
 		repeat_elem = tree_root.multiply_elem or tree_root.last
@@ -903,16 +1693,126 @@ def wrap_with_abbreviation(abbr, text, doc_type='html', profile='plain'):
 		
 		tree = rollout_tree(tree_root)
 		apply_filters(tree, doc_type, profile, tree_root.filters);
-		return replace_variables(tree.to_string())
+		return _iter_output(tree, base_indent)
 	
 	return None
 
+def _iter_output(tree, base_indent=''):
+	"""
+	Generates serialized output of expanded tree with replaced variables
+	and base indentation. Variables and newlines never span chunk 
+	boundaries since each one comes from single snippet or attribute string
+	"""
+	return _fill_chunks(tree.iter_chunks(), base_indent)
+
+def _fill_chunks(chunks, base_indent=''):
+	"""
+	Replaces variables in output chunks and pads them with base indentation
+	@type chunks: iterable
+	@type base_indent: str
+	@return: generator of str
+	"""
+	for chunk in chunks:
+		chunk = replace_variables(chunk)
+		if base_indent:
+			chunk = pad_string(chunk, base_indent)
+		yield chunk
+
+def expand_many(abbrs, syntax='html', profile_name='plain', workers=1, chunk_size=512):
+	"""
+	Expands a batch of abbreviations. Each distinct abbreviation is 
+	expanded once; large batches are spread over a pool of worker 
+	processes, which receive settings of current context only once, 
+	on start up.
+	
+	Pool is used only when it can pay off: on machines with several CPU
+	cores, for at least <code>min_pool_batch</code> distinct abbreviations
+	and more than one chunk. Otherwise (and for contexts with generated
+	caret placeholder) batch is expanded in current process: with a
+	single core, pool only adds process start up and data transfer.
+	@param abbrs: Abbreviations to expand
+	@type abbrs: iterable
+	@param syntax: Syntax name ('html', 'css', etc.)
+	@type syntax: str
+	@param profile_name: Output profile's name
+	@type profile_name: str
+	@param workers: Number of worker processes: 1 expands everything in 
+	current process, None uses all CPU cores. It's never larger than 
+	number of CPU cores
+	@type workers: int
+	@param chunk_size: How many abbreviations are sent to worker at once
+	@type chunk_size: int
+	@return: list of expanded abbreviations, in input order
+	"""
+	abbrs = list(abbrs)
+	unique = list(dict.fromkeys(abbrs))
+	
+	cpu_count = os.cpu_count() or 1
+	workers = min(workers or cpu_count, cpu_count)
+	
+	context = get_context()
+	if workers > 1 and len(unique) >= min_pool_batch and len(unique) > chunk_size \
+			and not callable(context.caret_placeholder):
+		results = _expand_in_pool(unique, syntax, profile_name, workers, chunk_size, context)
+	else:
+		results = _expand_chunk(unique, syntax, profile_name)
+	
+	expanded = dict(zip(unique, results))
+	return [expanded[abbr] for abbr in abbrs]
+
+def _expand_chunk(abbrs, syntax, profile_name):
+	"""
+	Expands list of distinct abbreviations in current context. Caches are
+	bypassed: there are no repeats in batch and it would only push out
+	cached items of interactive expansions
+	@return: list of str
+	"""
+	profile = get_profile(profile_name)
+	result = []
+	for abbr in abbrs:
+		tree_root = _parse_into_tree(abbr, syntax)
+		if tree_root:
+			tree = rollout_tree(tree_root)
+			apply_filters(tree, syntax, profile, tree_root.filters)
+			result.append(''.join(_iter_output(tree)))
+		else:
+			result.append('')
+	
+	return result
+
+def _expand_in_pool(abbrs, syntax, profile_name, workers, chunk_size, context):
+	"""
+	Expands abbreviations in pool of worker processes
+	@type context: ExpansionContext
+	@return: list of str
+	"""
+	from concurrent.futures import ProcessPoolExecutor
+	
+	chunks = [abbrs[i:i + chunk_size] for i in range(0, len(abbrs), chunk_size)]
+	state = (context.settings, context.variables, context.newline,
+			context.caret_placeholder, context.profiles)
+	
+	with ProcessPoolExecutor(min(workers, len(chunks)), initializer=_init_worker, initargs=state) as executor:
+		result = []
+		for chunk_result in executor.map(_expand_chunk, chunks, 
+				itertools.repeat(syntax), itertools.repeat(profile_name)):
+			result.extend(chunk_result)
+	
+	return result
+
+def _init_worker(settings, variables, newline, caret_placeholder, profiles):
+	"""
+	Sets up expansion context of worker process
+	"""
+	activate_context(ExpansionContext(settings, variables, newline, caret_placeholder, profiles))
+
 def get_caret_placeholder():
 	"""
 	Returns caret placeholder
 	@return: str
 	"""
-	if isinstance(caret_placeholder, collections.Callable):
+	caret_placeholder = get_context().caret_placeholder
+	if callable(caret_placeholder):
 		return caret_placeholder()
 	else:
 		return caret_placeholder
@@ -925,8 +1825,10 @@ def set_caret_placeholder(value):
 	between them.
 	@param {String|Function}
 	"""
-	global caret_placeholder
-	caret_placeholder = value
+	context = get_context()
+	if value is not context.caret_placeholder:
+		context.caret_placeholder = value
+		context.touch()
 
 def apply_filters(tree, syntax, profile, additional_filters=None):
 	"""
@@ -942,20 +1844,35 @@ def apply_filters(tree, syntax, profile, additional_filters=None):
 	 
 	@return: ZenNode
 	"""
-	_filters = get_resource(syntax, 'filters') or basic_filters
-		
-	if additional_filters:
-		_filters += '|'
-		if isinstance(additional_filters, str):
-			_filters += additional_filters
-		else:
-			_filters += '|'.join(additional_filters)
-		
-	if not _filters:
-		# looks like unknown syntax, apply basic filters
-		_filters = basic_filters
-		
-	return run_filters(tree, profile, _filters)
+	return run_filters(tree, profile, get_filter_chain(syntax, additional_filters))
+
+def cache_stats():
+	"""
+	Returns usage statistics of Zen Coding caches
+	@return: dict
+	"""
+	return {
+		'parse': parse_cache.stats(),
+		'template': template_cache.stats(),
+		'counter': counter_cache.stats(),
+		'filter': filter_cache.stats()
+	}
+
+def _counter_width(text, pos):
+	"""
+	Returns length of counter (sequence of '$' symbols) at <code>pos</code>
+	or 0 if '$' at this position starts a variable or tabstop
+	@type text: str
+	@type pos: int
+	@return: int
+	"""
+	next_char = char_at(text, pos + 1)
+	if next_char == '{' or next_char.isdigit():
+		return 0
+	
+	j = pos + 1
+	while char_at(text, j) == '$' and char_at(text, j + 1) != '{': j += 1
+	return j - pos
 
 def replace_counter(text, value):
 	"""
@@ -964,45 +1881,176 @@ def replace_counter(text, value):
 	 @type value: str, int
 	 @return: str
 	"""
-	symbol = '$'
 	value = str(value)
 	
 	def replace_func(tx, symbol, pos, match_num):
-		if char_at(tx, pos + 1) == '{' or char_at(tx, pos + 1).isdigit():
-			# it's a variable, skip it
+		# replace sequense of $ symbols with padded number  
+		width = _counter_width(tx, pos)
+		return width and (tx[pos:pos + width], value.zfill(width))
+	
+	return replace_unescaped_symbol(text, '$', replace_func)
+
+class CounterTemplate(object):
+	"""
+	Output string split by counters: literal pieces (already unescaped)
+	and padding width of each counter. Used to output repeated elements
+	without rescanning the same string for every repetition
+	"""
+	__slots__ = ('head', 'slots')
+	
+	def __init__(self, text):
+		"""
+		@param text: String with counters and escaped characters
+		@type text: str
+		"""
+		counters = []
+		def collect(tx, symbol, pos, match_num):
+			width = _counter_width(tx, pos)
+			if width:
+				counters.append((pos, width))
+				return (tx[pos:pos + width], '')
 			return False
 		
-		# replace sequense of $ symbols with padded number  
-		j = pos + 1
-		if j < len(text):
-			while tx[j] == '$' and char_at(tx, j + 1) != '{': j += 1
+		replace_unescaped_symbol(text, '$', collect)
+		
+		pieces = []
+		last = 0
+		for pos, width in counters:
+			pieces.append(unescape_text(text[last:pos]))
+			last = pos + width
+		pieces.append(unescape_text(text[last:]))
+		
+		self.head = pieces[0]
+		self.slots = tuple(zip([width for pos, width in counters], pieces[1:]))
+	
+	def fill(self, value):
+		"""
+		Returns string with counters replaced by <code>value</code>
+		@type value: int, str
+		@return: str
+		"""
+		if not self.slots:
+			return self.head
 		
-		return (tx[pos:j], value.zfill(j - pos))
+		value = str(value)
+		result = [self.head]
+		for width, piece in self.slots:
+			result.append(value.zfill(width))
+			result.append(piece)
+		
+		return ''.join(result)
+
+def get_counter_template(text):
+	"""
+	Returns cached <code>CounterTemplate</code> for output string
+	@type text: str
+	@return: CounterTemplate
+	"""
+	template = counter_cache.get(text)
+	if template is None:
+		template = CounterTemplate(text)
+		counter_cache.set(text, template)
 	
-	return replace_unescaped_symbol(text, symbol, replace_func)
+	return template
 
-def upgrade_tabstops(node):
+def fill_counter(text, value):
 	"""
-	Upgrades tabstops in zen node in order to prevent naming conflicts
-	@type node: ZenNode
-	@param offset: Tab index offset
-	@type offset: int
-	@returns Maximum tabstop index in element
+	Replaces counters in output string of repeated node and unescapes 
+	special characters
+	@type text: str
+	@type value: int
+	@return: str
 	"""
-	max_num = [0]
-	props = ('start', 'end', 'content')
+	if '$' not in text and '\\' not in text:
+		return text
+	
+	return get_counter_template(text).fill(value)
+
+class TabstopRegistry(object):
+	"""
+	Renumbers tabstops of expanded abbreviation element by element, so
+	tabstops of different elements don't conflict (for example, two
+	snippets with $1). Every expansion owns its registry; the final
+	tabstop map is available in <code>tabstops</code> property
+	"""
+	def __init__(self):
+		self.offset = 0
+		"Maximum tabstop index used so far"
+		
+		self.tabstops = {}
+		"Final tabstop index -> placeholder (empty string if none)"
 	
-	def _replace(m):
-		num = int(m.group(1) or m.group(2))
-		if num > max_num[0]: max_num[0] = num
-		return re.sub(r'\d+', str(num + max_tabstop), m.group(0), 1)
+	def upgrade(self, node):
+		"""
+		Upgrades tabstops in output strings of zen node
+		@type node: ZenNode
+		@return: Maximum tabstop index in element, before upgrade
+		"""
+		max_num = 0
+		for prop in ('start', 'end', 'content'):
+			text = getattr(node, prop)
+			if '$' in text:
+				text, num = self._upgrade_text(text)
+				setattr(node, prop, text)
+				max_num = max(max_num, num)
+		
+		self.offset += max_num
+		return max_num
 	
-	for prop in props:
-		node.__setattr__(prop, re.sub(r'\$(\d+)|\$\{(\d+):[^\}]+\}', _replace, node.__getattribute__(prop)))
+	def _upgrade_text(self, text):
+		"""
+		Shifts all tabstop indexes in text by current offset in one pass
+		@return: (new_text, max_tabstop_index) tuple
+		"""
+		pieces = []
+		last = 0
+		max_num = 0
+		tabstops = self.tabstops
 		
-	globals()['max_tabstop'] += max_num[0]
+		for m in re_tabstop.finditer(text):
+			num = int(m.group(1) or m.group(2))
+			if num > max_num: max_num = num
+			
+			index = num + self.offset
+			placeholder = m.group(3)
+			pieces.append(text[last:m.start()])
+			if placeholder is None:
+				pieces.append('$' + str(index))
+			else:
+				pieces.append('${%d:%s}' % (index, placeholder))
+			
+			if placeholder or index not in tabstops:
+				tabstops[index] = placeholder or ''
+			
+			last = m.end()
+		
+		if not pieces:
+			return text, 0
 		
-	return max_num[0]
+		pieces.append(text[last:])
+		return ''.join(pieces), max_num
+
+def has_tabstops(tag):
+	"""
+	Tests if tag or any of its descendants contain tabstops in snippet,
+	attributes or content
+	@type tag: Tag
+	@return: bool
+	"""
+	items = [tag]
+	items.extend([item for item, level in walk_tree(tag)])
+	for item in items:
+		texts = [item.get_content()]
+		if isinstance(item, Snippet):
+			texts.append(item.value)
+		else:
+			texts.extend([a['value'] for a in item.attributes])
+		
+		for text in texts:
+			if text and '$' in text and re_tabstop.search(text):
+				return True
+	
+	return False
 
 def unescape_text(text):
 	"""
@@ -1010,18 +2058,40 @@ def unescape_text(text):
 	@type text: str
 	@return: str
 	"""
-	return re.sub(r'\\(.)', r'\1', text)
+	return re_escaped_char.sub(r'\1', text)
 
 def get_profile(name):
 	"""
 	Get profile by it's name. If profile wasn't found, returns 'plain' profile
 	"""
+	profiles = get_context().profiles
 	return profiles[name] if name in profiles else profiles['plain']
 
-def update_settings(settings):
-	globals()['zen_settings'] = settings
+def update_settings(settings, context=None):
+	"""
+	Replaces settings of current context
+	@type settings: dict
+	@param context: Context to update, current one if omitted
+	@type context: ExpansionContext
+	"""
+	context = context or get_context()
+	context.settings = settings
+	if context is default_context:
+		globals()['zen_settings'] = settings
+	context.touch()
+
+def invalidate_caches():
+	"""
+	Marks all cached data (like parsed abbreviations) of current context 
+	as outdated. Must be called each time settings are changed in place
+	"""
+	get_context().settings_changed()
 	
 class Tag(object):
+	__slots__ = ('name', 'count', 'children', 'attributes', 'multiply_elem',
+			'_abbr', '__content', '__attr_hash', 'repeat_by_lines', '_res',
+			'parent', 'last', 'filters')
+	
 	def __init__(self, name, count=1, doc_type='html'):
 		"""
 		@param name: Tag name
@@ -1033,27 +2103,33 @@ class Tag(object):
 		"""
 		name = name.lower()
 		
+		# references are already resolved by settings index
 		abbr = get_abbreviation(doc_type, name)
-		
-		if abbr and abbr.type == stparser.TYPE_REFERENCE:
-			abbr = get_abbreviation(doc_type, abbr.value)
-		
+
+		if abbr and abbr.type == stparser.TYPE_EXPANDO:
+			# expandos are resolved by parser, this one can't be expanded
+			abbr = None
+
 		self.name = abbr and abbr.value['name'] or name.replace('+', '')
 		self.count = count
-		self.children = []
+		self.children = ()
 		self.attributes = []
-		self.multiply_elem = None
 		self.__attr_hash = {}
+		self.multiply_elem = None
 		self._abbr = abbr
 		self.__content = ''
 		self.repeat_by_lines = False
+		zen_settings = get_context().settings
 		self._res = doc_type in zen_settings and zen_settings[doc_type] or {}
 		self.parent = None
 		
+		# set by parser on tree root only
+		self.last = None
+		self.filters = ''
+		
 		# add default attributes
 		if self._abbr and 'attributes' in self._abbr.value:
-			for a in self._abbr.value['attributes']:
-				self.add_attribute(a['name'], a['value'])
+			self.add_attributes([(a['name'], a['value']) for a in self._abbr.value['attributes']])
 		
 	def add_child(self, tag):
 		"""
@@ -1061,7 +2137,10 @@ class Tag(object):
 		@type tag: Tag
 		"""
 		tag.parent = self
-		self.children.append(tag)
+		if self.children:
+			self.children.append(tag)
+		else:
+			self.children = [tag]
 		
 	def add_attribute(self, name, value):
 		"""
@@ -1074,24 +2153,34 @@ class Tag(object):
 		@type value: str
 		"""
 		
-		# the only place in Tag where pipe (caret) character may exist
-		# is the attribute: escape it with internal placeholder
-		value = replace_unescaped_symbol(value, '|', get_caret_placeholder());
-		
-		if name in self.__attr_hash:
-#			attribue already exists
-			a = self.__attr_hash[name]
-			if name == 'class':
-#				'class' is a magic attribute
-				if a['value']:
-					value = ' ' + value
-				a['value'] += value
+		self.add_attributes(((name, value),))
+	
+	def add_attributes(self, attributes):
+		"""
+		Adds attributes to tag, like <code>add_attribute()</code> does
+		@param attributes: (name, value) pairs
+		@type attributes: iterable
+		"""
+		index = self.__attr_hash
+		for name, value in attributes:
+			# the only place in Tag where pipe (caret) character may exist
+			# is the attribute: escape it with internal placeholder
+			value = replace_unescaped_symbol(value, '|', get_caret_placeholder());
+			
+			a = index.get(name)
+			if a is not None:
+#				attribue already exists
+				if name == 'class':
+#					'class' is a magic attribute
+					if a['value']:
+						value = ' ' + value
+					a['value'] += value
+				else:
+					a['value'] = value
 			else:
-				a['value'] = value
-		else:
-			a = {'name': name, 'value': value}
-			self.__attr_hash[name] = a
-			self.attributes.append(a)
+				a = {'name': name, 'value': value}
+				self.attributes.append(a)
+				index[name] = a
 	
 	def has_tags_in_content(self):
 		"""
@@ -1129,12 +2218,42 @@ class Tag(object):
 		
 		return deepest_child
 	
+	def clone(self):
+		"""
+		Creates a copy of current tag and all its descendants. Attributes and
+		settings data are shared with the original tree, since they are never
+		modified after parsing
+		@return: Tag
+		"""
+		copies = {}
+		stack = [(self, None)]
+		while stack:
+			tag, parent = stack.pop()
+			item = copy.copy(tag)
+			item.children = ()
+			copies[id(tag)] = item
+			if parent:
+				parent.add_child(item)
+			
+			stack.extend((child, item) for child in reversed(tag.children))
+		
+		root = copies[id(self)]
+		root.parent = None
+		if self.last:
+			root.last = copies.get(id(self.last))
+		if self.multiply_elem:
+			root.multiply_elem = copies.get(id(self.multiply_elem))
+		
+		return root
+	
 class Snippet(Tag):
+	__slots__ = ('value',)
+	
 	def __init__(self, name, count=1, doc_type='html'):
 		super(Snippet, self).__init__(name, count, doc_type)
 		self.value = replace_unescaped_symbol(get_snippet(doc_type, name), '|', get_caret_placeholder())
 		self.attributes = {'id': get_caret_placeholder(), 'class': get_caret_placeholder()}
-		self._res = zen_settings[doc_type]		
+		self._res = get_context().settings[doc_type]
 	
 	def is_block(self):
 		return True
@@ -1143,6 +2262,11 @@ class ZenNode(object):
 	"""
 	Creates simplified tag from Zen Coding tag
 	"""
+	__slots__ = ('type', 'name', 'attributes', 'children', 'counter', 'repeat',
+			'source', 'parent', 'next_sibling', 'previous_sibling',
+			'start', 'end', 'content', 'padding', 'tabstops', 'flags', 'layout',
+			'inline_run')
+	
 	def __init__(self, tag):
 		"""
 		@type tag: Tag
@@ -1150,9 +2274,16 @@ class ZenNode(object):
 		self.type = 'snippet' if isinstance(tag, Snippet) else 'tag'
 		self.name = tag.name
 		self.attributes = tag.attributes
-		self.children = [];
+		# most nodes are leaves: share empty tuple until first child is added
+		self.children = ()
 		self.counter = 1
 		
+		self.repeat = 1
+		"""How many times this node should be outputted. Repeated node is
+		processed by filters once; its counters (like '$' in attributes)
+		are replaced for each repetition on output, starting with 
+		<code>counter</code>"""
+		
 		self.source = tag
 		"Source element from which current tag was created"
 		
@@ -1166,6 +2297,20 @@ class ZenNode(object):
 		self.end = ''
 		self.content = ''
 		self.padding = ''
+		
+		self.tabstops = None
+		"TabstopRegistry of expansion, set on tree nodes by output filter"
+		
+		self.flags = get_element_flags(tag._res, self.name)
+		"Element classification, bit mask of <code>stparser.ELEMENT_*</code>"
+		if self.type == 'tag' and tag._abbr and tag._abbr.value['is_empty']:
+			self.flags |= stparser.ELEMENT_EMPTY
+		
+		self.layout = None
+		"Layout facts, bit mask of <code>LAYOUT_*</code>"
+		
+		self.inline_run = None
+		"Size of run of inline siblings this node belongs to"
 
 	def add_child(self, tag):
 		"""
@@ -1177,8 +2322,9 @@ class ZenNode(object):
 			last_child = self.children[-1]
 			tag.previous_sibling = last_child
 			last_child.next_sibling = tag
-		
-		self.children.append(tag)
+			self.children.append(tag)
+		else:
+			self.children = [tag]
 		
 	def get_attribute(self, name):
 		"""
@@ -1201,14 +2347,14 @@ class ZenNode(object):
 		if self.type == 'snippet':
 			return False
 			
-		return (self.source._abbr and self.source._abbr.value['is_empty']) or (self.name in get_elements_collection(self.source._res, 'empty'))
+		return self.flags & stparser.ELEMENT_EMPTY != 0
 	
 	def is_inline(self):
 		"""
 		Test if current tag is inline-level (like <strong>, <img>)
 		@return: bool
 		"""
-		return self.name in get_elements_collection(self.source._res, 'inline_level')
+		return self.flags & stparser.ELEMENT_INLINE != 0
 	
 	def is_block(self):
 		"""
@@ -1224,6 +2370,32 @@ class ZenNode(object):
 		"""
 		return self.content and re_tag.search(self.content)
 	
+	def get_layout(self):
+		"""
+		Returns layout facts of current node, computed by 
+		<code>compute_layout()</code>, or computes them for this node
+		@return: int
+		"""
+		if self.layout is None:
+			self.layout = _get_node_layout(self)
+		
+		return self.layout
+	
+	def get_inline_run(self):
+		"""
+		Returns how many inline elements (including current one and 
+		repetitions) are outputted in a row with current node; zero for 
+		non-inline node
+		@return: int
+		"""
+		if self.inline_run is None:
+			first = self
+			while first.previous_sibling:
+				first = first.previous_sibling
+			_set_inline_runs(first)
+		
+		return self.inline_run
+	
 	def has_children(self):
 		"""
 		Check if tag has child elements
@@ -1262,10 +2434,52 @@ class ZenNode(object):
 		
 		return deepest_child
 	
+	def iter_chunks(self):
+		"""
+		Generates output of current node and all its descendants chunk by
+		chunk, in document order. Tree is walked with explicit stack, so no
+		intermediate strings are built for nested elements
+		@return: generator of str
+		"""
+		stack = [(self, self.counter)]
+		while stack:
+			item = stack.pop()
+			if isinstance(item, str):
+				if item:
+					yield item
+				continue
+			
+			node, counter = item
+			if counter < node.counter + node.repeat - 1:
+				# schedule next repetition of the same node
+				stack.append((node, counter + 1))
+			
+			if node.repeat > 1:
+				start = fill_counter(node.start, counter)
+				stack.append(fill_counter(node.end, counter))
+			else:
+				start = node.start
+				stack.append(node.end)
+			
+			stack.extend([(child, child.counter) for child in reversed(node.children)])
+			
+			if start:
+				yield start
+			if node.content:
+				yield node.content
+	
+	def write_to(self, stream):
+		"""
+		Writes output of current node into file-like object
+		@param stream: Object with <code>write()</code> method
+		"""
+		write = stream.write
+		for chunk in self.iter_chunks():
+			write(chunk)
+	
 	def to_string(self):
 		"@return {String}"
-		content = ''.join([item.to_string() for item in self.children])
-		return self.start + self.content + content + self.end
+		return ''.join(self.iter_chunks())
 		
 # create default profiles
 setup_profile('xhtml');
@@ -1273,7 +2487,7 @@ setup_profile('html', {'self_closing_tag': False});
 setup_profile('xml', {'self_closing_tag': True, 'tag_nl': True});
 setup_profile('plain', {'tag_nl': False, 'indent': False, 'place_cursor': False});
 
-# This method call explicity loads default settings from zen_settings.py on start up
-# Comment this line if you want to load data from other resources (like editor's 
-# native snippet) 
-update_settings(stparser.get_settings())
+# Default settings from zen_settings.py are parsed when first needed, which
+# keeps start up fast. Call update_settings() to load data from other 
+# resources (like editor's native snippets)
+default_context = ExpansionContext()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Expansion daemon: keeps parsed settings and Zen Coding caches warm between
+runs and serves requests over Unix domain socket.
+
+Protocol is JSON Lines: each request is a JSON object on a single line,
+responses are written in the same order. Clients may send several requests
+without waiting for responses.
+
+Requests:
+{"id": 1, "op": "expand", "abbr": "ul>li*3", "syntax": "html", "profile": "xhtml", "indent": "\t"}
+{"id": 2, "op": "wrap", "abbr": "div", "text": "hello", "syntax": "html", "profile": "xhtml"}
+{"id": 3, "op": "match", "html": "<p>text</p>", "pos": 4, "mode": "xhtml"}
+{"id": 4, "op": "stats"}
+
+Optional "indent" of expand and wrap requests is added to each line of result
+except the first one.
+
+Responses: {"id": 1, "result": ...} or {"id": 1, "error": "message"}
+
+@example
+# server
+python -m zencoding serve
+# client (falls back to in-process expansion if daemon isn't running)
+from zencoding import zen_daemon
+client = zen_daemon.Client()
+client.expand_abbreviation('ul>li*3', 'html', 'xhtml')
+'''
+import json
+import os
+import signal
+import socket
+import stat
+import tempfile
+import time
+
+from . import zen_core, html_matcher
+
+max_line_size = 1024 * 1024
+"Maximum size of request line, in bytes"
+
+def default_socket_path():
+	"""
+	Returns default path of daemon's socket: inside user's runtime dir, if
+	available, or inside user's private directory in temp dir otherwise
+	@return: str
+	"""
+	runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+	if runtime_dir and os.path.isdir(runtime_dir):
+		return os.path.join(runtime_dir, 'zencoding.sock')
+
+	return os.path.join(_private_temp_dir(), 'zencoding.sock')
+
+def _private_temp_dir():
+	"@return: str"
+	return os.path.join(tempfile.gettempdir(), 'zencoding-%d' % os.getuid())
+
+def prepare_socket_path(path):
+	"""
+	Prepares <code>path</code> for binding daemon's socket: creates private
+	directory for default socket in temp dir and removes socket left by
+	daemon that is not running anymore
+	@type path: str
+	@raise DaemonError: Path is taken by another file, running daemon or
+	directory that is not private
+	"""
+	dirname = os.path.dirname(path)
+	if dirname == _private_temp_dir():
+		try:
+			os.mkdir(dirname, 0o700)
+		except FileExistsError:
+			pass
+
+		info = os.lstat(dirname)
+		if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() \
+				or info.st_mode & 0o077:
+			raise DaemonError('%s is not a private directory' % dirname)
+
+	try:
+		info = os.lstat(path)
+	except FileNotFoundError:
+		return
+
+	if not stat.S_ISSOCK(info.st_mode):
+		raise DaemonError('%s exists and is not a socket' % path)
+
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.connect(path)
+	except ConnectionRefusedError:
+		# socket left by previous run
+		os.unlink(path)
+		return
+	except FileNotFoundError:
+		return
+	finally:
+		sock.close()
+
+	raise DaemonError('Daemon is already running on %s' % path)
+
+def handle_request(request):
+	"""
+	Performs single request
+	@type request: dict
+	@return: Request result
+	@raise ValueError: Invalid request
+	"""
+	op = request.get('op')
+	if op == 'expand':
+		return zen_core.expand_abbreviation(_get_str(request, 'abbr'),
+				request.get('syntax', 'html'), request.get('profile', 'plain'),
+				_get_str(request, 'indent', ''))
+	elif op == 'wrap':
+		return zen_core.wrap_with_abbreviation(_get_str(request, 'abbr'),
+				_get_str(request, 'text'), request.get('syntax', 'html'),
+				request.get('profile', 'plain'), _get_str(request, 'indent', ''))
+	elif op == 'match':
+		pos = request.get('pos')
+		if not isinstance(pos, int):
+			raise ValueError('"pos" must be an integer')
+		return html_matcher.match(_get_str(request, 'html'), pos, request.get('mode', 'xhtml'))
+
+	raise ValueError('Unknown operation: %r' % (op,))
+
+def _get_str(request, name, default=None):
+	value = request.get(name, default)
+	if not isinstance(value, str):
+		raise ValueError('"%s" must be a string' % name)
+	return value
+
+class Server(object):
+	"""
+	Asyncio-based expansion server
+	"""
+	def __init__(self, path=None, max_clients=16):
+		"""
+		@param path: Socket path, <code>default_socket_path()</code> if omitted
+		@type path: str
+		@param max_clients: How many clients may be connected at once;
+		other connections are refused with 'busy' error
+		@type max_clients: int
+		"""
+		self.path = path or default_socket_path()
+		self.max_clients = max_clients
+		self.clients = 0
+		self.requests = 0
+		self.errors = 0
+		self.refused = 0
+		self.started = time.time()
+
+	def stats(self):
+		"""
+		Returns server and cache statistics
+		@return: dict
+		"""
+		return {
+			'uptime': time.time() - self.started,
+			'clients': self.clients,
+			'max_clients': self.max_clients,
+			'requests': self.requests,
+			'errors': self.errors,
+			'refused': self.refused,
+			'caches': zen_core.cache_stats()
+		}
+
+	def respond(self, line):
+		"""
+		Creates response line for request line
+		@type line: bytes
+		@return: bytes
+		"""
+		self.requests += 1
+		response = {}
+		try:
+			request = json.loads(line)
+			if not isinstance(request, dict):
+				raise ValueError('Request must be an object')
+
+			if 'id' in request:
+				response['id'] = request['id']
+
+			if request.get('op') == 'stats':
+				response['result'] = self.stats()
+			else:
+				response['result'] = handle_request(request)
+		except Exception as e:
+			self.errors += 1
+			response['error'] = str(e)
+
+		return (json.dumps(response) + '\n').encode('utf-8')
+
+	async def handle_client(self, reader, writer):
+		"""
+		Serves client connection: reads requests line by line and writes
+		responses in the same order
+		"""
+		import asyncio
+
+		if self.clients >= self.max_clients:
+			self.refused += 1
+			writer.write(b'{"error": "busy"}\n')
+			await writer.drain()
+			writer.close()
+			return
+
+		self.clients += 1
+		try:
+			while True:
+				try:
+					line = await reader.readline()
+				except (ValueError, asyncio.LimitOverrunError):
+					writer.write(b'{"error": "Request is too large"}\n')
+					break
+
+				if not line:
+					break
+
+				if line.strip():
+					writer.write(self.respond(line))
+					await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			self.clients -= 1
+			writer.close()
+
+	async def serve(self, on_ready=None):
+		"""
+		Starts server and serves requests until cancelled
+		@param on_ready: Function called once socket is bound and server 
+		accepts connections
+		"""
+		import asyncio
+
+		prepare_socket_path(self.path)
+
+		# socket is accessible by its owner only
+		umask = os.umask(0o077)
+		try:
+			server = await asyncio.start_unix_server(self.handle_client,
+					self.path, limit=max_line_size)
+		finally:
+			os.umask(umask)
+		socket_id = _file_id(self.path)
+		if on_ready:
+			on_ready()
+
+		# stop gracefully on SIGTERM, removing socket file
+		loop = asyncio.get_running_loop()
+		try:
+			loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+		except (NotImplementedError, RuntimeError):
+			pass
+
+		try:
+			async with server:
+				await server.serve_forever()
+		finally:
+			# socket may be replaced by another daemon already
+			if _file_id(self.path) == socket_id:
+				os.unlink(self.path)
+
+	def run(self, on_ready=None):
+		"""
+		Runs server in new event loop (blocks until interrupted)
+		@param on_ready: Function called once server accepts connections
+		"""
+		import asyncio
+
+		try:
+			asyncio.run(self.serve(on_ready))
+		except (KeyboardInterrupt, asyncio.CancelledError):
+			pass
+
+def _file_id(path):
+	"""
+	Returns identity of file at <code>path</code>, None if there's no file
+	@return: tuple
+	"""
+	try:
+		info = os.lstat(path)
+	except OSError:
+		return None
+	return (info.st_dev, info.st_ino)
+
+class DaemonError(Exception):
+	"""
+	Daemon can't be used or started: it isn't running, it's busy, 
+	connection failed or socket path is taken
+	"""
+
+class Client(object):
+	"""
+	Blocking client for expansion daemon. Methods mirror zen_core functions;
+	if daemon is not available, requests are performed in current process
+	with the same caret placeholder and newline as daemon uses
+	"""
+	def __init__(self, path=None, fallback=True, timeout=5.0,
+			caret_placeholder='', newline='\n'):
+		"""
+		@param path: Socket path, <code>default_socket_path()</code> if omitted
+		@type path: str
+		@param fallback: Perform requests in current process if daemon isn't
+		available (otherwise <code>DaemonError</code> is raised)
+		@type fallback: bool
+		@param timeout: Socket timeout, in seconds
+		@type timeout: float
+		@param caret_placeholder: Caret placeholder of fallback expansions,
+		should match the one daemon was started with
+		@type caret_placeholder: str
+		@param newline: Newline of fallback expansions
+		@type newline: str
+		"""
+		self.path = path or default_socket_path()
+		self.fallback = fallback
+		self.timeout = timeout
+		self.caret_placeholder = caret_placeholder
+		self.newline = newline
+		self._sock = None
+		self._file = None
+		self._context = None
+
+	def connect(self):
+		"""
+		Connects to daemon, if not connected yet
+		@raise DaemonError:
+		"""
+		if self._sock is not None:
+			return
+
+		try:
+			sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			sock.settimeout(self.timeout)
+			sock.connect(self.path)
+		except (OSError, AttributeError) as e:
+			raise DaemonError(str(e))
+
+		self._sock = sock
+		self._file = sock.makefile('rb')
+
+	def close(self):
+		"""
+		Closes connection to daemon
+		"""
+		if self._sock is not None:
+			self._file.close()
+			self._sock.close()
+			self._sock = self._file = None
+
+	def request_many(self, requests):
+		"""
+		Sends requests to daemon at once and reads responses
+		@type requests: list
+		@return: list of response dicts
+		@raise DaemonError:
+		"""
+		self.connect()
+		try:
+			self._sock.sendall(''.join([json.dumps(r) + '\n' for r in requests]).encode('utf-8'))
+			responses = []
+			for r in requests:
+				line = self._file.readline()
+				if not line:
+					raise DaemonError('Connection closed by daemon')
+
+				response = json.loads(line)
+				if response.get('error') == 'busy' and 'id' not in response:
+					raise DaemonError('Daemon is busy')
+				responses.append(response)
+		except (OSError, ValueError, DaemonError) as e:
+			self.close()
+			raise e if isinstance(e, DaemonError) else DaemonError(str(e))
+
+		return responses
+
+	def request(self, request):
+		"""
+		Performs request on daemon, or in current process if daemon is not
+		available and fallback is enabled
+		@type request: dict
+		@return: Request result
+		"""
+		try:
+			response = self.request_many([request])[0]
+		except DaemonError:
+			if not self.fallback:
+				raise
+
+			if request.get('op') == 'stats':
+				return None
+
+			if self._context is None:
+				# created once, so its caches are reused by next requests
+				self._context = zen_core.get_context().derive(
+						caret_placeholder=self.caret_placeholder, newline=self.newline)
+			with self._context:
+				return handle_request(request)
+
+		if 'error' in response:
+			raise ValueError(response['error'])
+		return response.get('result')
+
+	def expand_abbreviation(self, abbr, syntax='html', profile_name='plain', base_indent=''):
+		"@return: str"
+		return self.request({'op': 'expand', 'abbr': abbr, 'syntax': syntax,
+				'profile': profile_name, 'indent': base_indent})
+
+	def wrap_with_abbreviation(self, abbr, text, doc_type='html', profile='plain', base_indent=''):
+		"@return: str"
+		return self.request({'op': 'wrap', 'abbr': abbr, 'text': text, 'syntax': doc_type,
+				'profile': profile, 'indent': base_indent})
+
+	def match(self, html, start_ix, mode='xhtml'):
+		"@return: list of start and end indexes or None"
+		return self.request({'op': 'match', 'html': html, 'pos': start_ix, 'mode': mode})
+
+	def stats(self):
+		"@return: dict, None if daemon is not running"
+		return self.request({'op': 'stats'})
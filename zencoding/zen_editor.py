@@ -20,7 +20,7 @@ Gedit implementation:
 '''
 
 from . import zen_core, zen_actions
-import os, re, locale
+import os, re, locale, weakref
 from . import zen_dialog
 
 class ZenEditor():
@@ -28,7 +28,19 @@ class ZenEditor():
     def __init__(self):
         self.last_wrap = ''
         self.last_expand = ''
-        zen_core.set_caret_placeholder('')
+        # expansion context (variables, indentation, etc.) of each document
+        self.zen_contexts = weakref.WeakKeyDictionary()
+
+    def get_zen_context(self, document):
+        """
+        Returns expansion context of document, creating it on first call
+        @return: zen_core.ExpansionContext
+        """
+        zen_context = self.zen_contexts.get(document)
+        if zen_context is None:
+            zen_context = zen_core.ExpansionContext(caret_placeholder='')
+            self.zen_contexts[document] = zen_context
+        return zen_context
 
     def set_context(self, context):
         """
@@ -41,22 +53,26 @@ class ZenEditor():
         self.view = context.get_active_view()
         self.document = context.get_active_document()
         
+        # variables below are set for current document only
+        zen_context = self.get_zen_context(self.document)
+        zen_core.activate_context(zen_context)
+        
         default_locale = locale.getdefaultlocale()[0] if locale.getdefaultlocale()[0] else "en_US"
         lang = re.sub(r'_[^_]+$', '', default_locale)
         if lang != default_locale:
-            zen_core.set_variable('lang', lang)
-            zen_core.set_variable('locale', default_locale.replace('_', '-'))
+            zen_context.set_variable('lang', lang)
+            zen_context.set_variable('locale', default_locale.replace('_', '-'))
         else:
-            zen_core.set_variable('lang', default_locale)
-            zen_core.set_variable('locale', default_locale)
+            zen_context.set_variable('lang', default_locale)
+            zen_context.set_variable('locale', default_locale)
         
         self.encoding = self.document.get_encoding().get_charset()
-        zen_core.set_variable('charset', self.encoding)
+        zen_context.set_variable('charset', self.encoding)
         
         if self.view.get_insert_spaces_instead_of_tabs():
-            zen_core.set_variable('indentation', " " * context.get_active_view().get_tab_width())
+            zen_context.set_variable('indentation', " " * context.get_active_view().get_tab_width())
         else:
-            zen_core.set_variable('indentation', "\t")
+            zen_context.set_variable('indentation', "\t")
         
     def get_selection_range(self):
         """
@@ -126,7 +142,7 @@ class ZenEditor():
         iter_end = self.buffer.get_iter_at_offset(offset_end)
         return self.buffer.get_text(iter_start, iter_end, False)#.decode(self.encoding)
 
-    def replace_content(self, value, offset_start=None, offset_end=None):
+    def replace_content(self, value, offset_start=None, offset_end=None, indented=False):
         """
         Replace editor's content or its part (from start to end index). If 
         value contains caret_placeholder, the editor will put caret into
@@ -144,6 +160,9 @@ class ZenEditor():
         @type start: int
         @param end: End index of editor's content
         @type end: int
+        @param indented: Value is already indented with padding of current
+        line (see <code>base_indent</code> of zen_core expand functions)
+        @type indented: bool
         """
         if offset_start is None and offset_end is None:
             iter_start = self.buffer.get_iter_at_offset(0)
@@ -158,8 +177,9 @@ class ZenEditor():
         self.buffer.delete(iter_start, iter_end)
         self.insertion_start = self.get_insert_offset()
         
-        padding = zen_actions.get_current_line_padding(self)
-        self.buffer.insert_at_cursor(zen_core.pad_string(value, padding))
+        if not indented:
+            value = zen_core.pad_string(value, zen_actions.get_current_line_padding(self))
+        self.buffer.insert_at_cursor(value)
 
         self.insertion_end = self.get_insert_offset()
 